@@ -0,0 +1,433 @@
+'''
+Route level benchmarks for the Catalog app.
+
+Seeds a synthetic catalog for each of the given sizes and times every route
+in the views module through the Flask test client.  Each route is measured
+in its own process, so the peak memory reported belongs to that route.
+
+For every route the following are reported:
+    requests/sec, p50/p95/p99 latency, peak RSS and SQL queries per request.
+
+A route is flagged when its p50 latency or query count at the largest
+catalog grows by more than the allowed factor over the smallest catalog.
+The list routes read one page at a time, so they should stay flat as the
+catalog grows; the full catalog exports are expected to grow.
+
+Usage, from the project's root directory:
+
+    python benchmark.py --sizes 1000,100000,1000000
+
+Notes:
+    The app's client_secret.json must exist, as it does to run the server.
+    Seeded databases are kept in the --data directory and reused by later
+    runs with the same size and seed.
+
+'''
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib
+from StringIO import StringIO
+
+RESULT = "RESULT "
+
+ROUTES = [
+    'listItem',
+    'listCategory',
+    'listUser',
+    'listCategoryItem',
+    'viewCatItem',
+    'viewItem',
+    'viewCategory',
+    'viewUser',
+    'itemJSON',
+    'catalogJSON',
+    'catalogXML',
+    'newItem (GET)',
+    'newItem (POST)',
+    'editCatItem',
+    'editItem (POST)',
+    'delItem',
+    'deleteItem (POST)',
+    'newCategory (GET)',
+    'newCategory (POST)',
+    'editCategory (GET)',
+    'editCategory (POST)',
+    'deleteCategory (GET)',
+    'deleteCategory (POST)',
+    'newUser (GET)',
+    'editUser (GET)'
+]
+
+
+def percentile(values, p):
+    '''The p-th percentile of a sorted list of values.'''
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
+
+
+def seedDatabase(size, seed):
+    '''Generate a catalog with size items in the configured database.'''
+    from catalog.populator import CatalogGenerator
+
+    CatalogGenerator(seed).generate(
+        max(10, size // 100),
+        max(10, size // 1000),
+        size
+    )
+
+
+class RouteBenchmark(object):
+    '''Times requests to the app's routes against a seeded database.
+
+    Attributes:
+        client (FlaskClient):   The test client requests are sent through.
+        queries (int):          SQL statements executed since the last reset.
+        item (Item):            An item from the catalog used by the view and
+            edit routes.
+        category (Category):    The item's category.
+        user_id (int):          The id of the item's creator, who is logged
+            in for the Item and User routes that require it.
+        categoryUserID (int):   The id of the category's creator, who is
+            logged in for the Category routes.
+    '''
+
+    def __init__(self):
+        import runserver
+        from sqlalchemy import event
+        from catalog.app import app
+        from catalog.database import engine, session
+        from catalog.models import Category, Item
+
+        app.secret_key = 'benchmark'
+
+        self.app = app
+        self.session = session
+        self.client = app.test_client()
+        self.queries = 0
+
+        # Names of the records created by this run, so they don't clash with
+        # those left in the database by earlier runs.
+        self.token = "%x" % int(time.time() * 1000)
+
+        event.listen(engine, 'before_cursor_execute', self.countQuery)
+
+        self.item = Item.query.order_by(Item.id).first()
+        self.category = Category.query.filter_by(id=self.item.cat_id).one()
+        self.user_id = self.item.user_id
+        self.itemID = self.item.id
+        self.itemName = self.item.name
+        self.categoryID = self.category.id
+        self.categoryName = self.category.name
+        self.categoryUserID = self.category.user_id
+        session.remove()
+
+    def countQuery(self, *args):
+        self.queries += 1
+
+    def login(self, user_id):
+        '''Stub a logged in session for a user.'''
+        with self.client.session_transaction() as login_session:
+            login_session['username'] = 'Benchmark'
+            login_session['email'] = 'benchmark@example.com'
+            login_session['picture'] = 'images/male_avatar.png'
+            login_session['user_id'] = user_id
+            login_session['_csrf_token'] = 'benchmark'
+
+    def newItemForm(self, name):
+        return {
+            '_csrf_token': 'benchmark',
+            'name': name,
+            'category': self.categoryName,
+            'created': '2016-01-01',
+            'description': 'A benchmark item.',
+            'picture': (StringIO(''), '')
+        }
+
+    def createItem(self, name):
+        '''Add an item owned by the logged in user, outside of the timing.'''
+        from catalog.models import Item
+
+        self.login(self.user_id)
+        self.client.post('/catalog/item/add', data=self.newItemForm(name))
+        item = Item.query.filter_by(
+            name=name, cat_id=self.categoryID).one()
+        key = item.id
+        self.session.remove()
+        return key
+
+    def createCategory(self, name):
+        '''Add a category owned by the logged in user.'''
+        from catalog.models import Category
+
+        self.login(self.categoryUserID)
+        self.client.post(
+            '/catalog/category/new/',
+            data={'_csrf_token': 'benchmark', 'name': name}
+        )
+        key = Category.query.filter_by(name=name).one().id
+        self.session.remove()
+        return key
+
+    def routes(self):
+        '''The requests made for each route in the views module.
+
+        Returns:
+            dict: Maps a route name to a function that is given the request
+                number and returns (method, url, form data, the id of the
+                user to log in or None).
+                Anything the request needs is prepared before it is timed.
+        '''
+        quote = lambda name: urllib.quote(name.encode('utf-8'))
+        item = '/catalog/item/%d' % self.itemID
+        catItem = '/catalog/%s/%s' % (
+            quote(self.categoryName), quote(self.itemName))
+        category = '/catalog/category/%d' % self.categoryID
+        user = '/catalog/user/%d' % self.user_id
+        token = self.token
+        owner = self.user_id
+        categoryOwner = self.categoryUserID
+
+        def newItem(n):
+            return ('post', '/catalog/item/add',
+                    self.newItemForm('Benchmark New %s %d' % (token, n)),
+                    owner)
+
+        def editItem(n):
+            form = self.newItemForm(self.itemName)
+            del form['picture']
+            form['upload'] = (StringIO(''), '')
+            return ('post', item + '/edit/', form, owner)
+
+        def deleteItem(n):
+            key = self.createItem('Benchmark Delete %s %d' % (token, n))
+            return ('post', '/catalog/item/%d/delete/' % key,
+                    {'_csrf_token': 'benchmark'}, owner)
+
+        def newCategory(n):
+            return ('post', '/catalog/category/new/',
+                    {'_csrf_token': 'benchmark',
+                     'name': 'Benchmark New %s %d' % (token, n)},
+                    categoryOwner)
+
+        def editCategory(n):
+            return ('post', category + '/edit/',
+                    {'_csrf_token': 'benchmark',
+                     'name': self.categoryName}, categoryOwner)
+
+        def deleteCategory(n):
+            key = self.createCategory('Benchmark Delete %s %d' % (token, n))
+            return ('post', '/catalog/category/%d/delete/' % key,
+                    {'_csrf_token': 'benchmark'}, categoryOwner)
+
+        def get(url, user_id=None):
+            return lambda n: ('get', url, None, user_id)
+
+        return {
+            'listItem': get('/'),
+            'listCategory': get('/catalog/category'),
+            'listUser': get('/catalog/user'),
+            'listCategoryItem': get(
+                '/catalog/%s/items' % quote(self.categoryName)),
+            'viewCatItem': get(catItem + '/'),
+            'viewItem': get(item + '/'),
+            'viewCategory': get(category + '/'),
+            'viewUser': get(user + '/'),
+            'itemJSON': get(item + '/JSON'),
+            'catalogJSON': get('/catalog/JSON'),
+            'catalogXML': get('/catalog/XML'),
+            'newItem (GET)': get('/catalog/item/add', owner),
+            'newItem (POST)': newItem,
+            'editCatItem': get(catItem + '/edit', owner),
+            'editItem (POST)': editItem,
+            'delItem': get(catItem + '/delete', owner),
+            'deleteItem (POST)': deleteItem,
+            'newCategory (GET)': get('/catalog/category/new/', categoryOwner),
+            'newCategory (POST)': newCategory,
+            'editCategory (GET)': get(category + '/edit/', categoryOwner),
+            'editCategory (POST)': editCategory,
+            'deleteCategory (GET)': get(category + '/delete/', categoryOwner),
+            'deleteCategory (POST)': deleteCategory,
+            'newUser (GET)': get('/catalog/user/new/', owner),
+            'editUser (GET)': get(user + '/edit/', owner)
+        }
+
+    def run(self, route, requests, timeLimit):
+        '''Time the requests to a route.
+
+        Args:
+            route (string):     A name from routes.
+            requests (int):     The most requests to make.
+            timeLimit (float):  Stop after this many seconds, once at least
+                three requests were made.
+
+        Returns:
+            dict: The measurements for the route.
+        '''
+        makeRequest = self.routes()[route]
+        latencies = []
+        queries = 0
+        status = None
+        started = time.time()
+
+        for n in range(requests):
+            method, url, data, user_id = makeRequest(n)
+
+            if user_id is not None:
+                self.login(user_id)
+
+            self.queries = 0
+            start = time.time()
+
+            response = getattr(self.client, method)(url, data=data)
+            response.get_data()
+            response.close()
+
+            latencies.append(time.time() - start)
+            queries += self.queries
+            status = response.status_code
+
+            if n >= 2 and time.time() - started > timeLimit:
+                break
+
+        latencies.sort()
+
+        return {
+            'route': route,
+            'status': status,
+            'requests': len(latencies),
+            'rps': len(latencies) / sum(latencies),
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+            'queries': float(queries) / len(latencies)
+        }
+
+
+def child(environment, *options):
+    '''Run this script for one task against the size's database.'''
+    command = [sys.executable, os.path.abspath(__file__)] + list(options)
+    output = subprocess.check_output(command, env=environment)
+
+    for line in output.splitlines():
+        if line.startswith(RESULT):
+            return json.loads(line[len(RESULT):])
+
+
+def report(size, results):
+    print "\n%d items" % size
+    print "%-22s %6s %9s %9s %9s %9s %9s %8s" % (
+        "route", "status", "req/s", "p50 ms", "p95 ms", "p99 ms",
+        "RSS MB", "queries")
+
+    for r in results:
+        print "%-22s %6s %9.1f %9.2f %9.2f %9.2f %9.1f %8.1f" % (
+            r['route'], r['status'], r['rps'], r['p50'], r['p95'], r['p99'],
+            r['rss'], r['queries'])
+
+
+def checkScaling(smallest, largest, results, factor):
+    '''Flag the routes whose latency or query count grows with the catalog.
+
+    Returns:
+        list: A description of each flagged route.
+    '''
+    flagged = []
+
+    for small, large in zip(results[smallest], results[largest]):
+        route = small['route']
+
+        if large['p50'] > small['p50'] * factor:
+            flagged.append(
+                "%s: p50 grew from %.2f ms to %.2f ms (%d to %d items)" % (
+                    route, small['p50'], large['p50'], smallest, largest))
+
+        if large['queries'] > small['queries'] + 0.5:
+            flagged.append(
+                "%s: queries grew from %.1f to %.1f (%d to %d items)" % (
+                    route, small['queries'], large['queries'],
+                    smallest, largest))
+
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Catalog app's routes.")
+    parser.add_argument(
+        '--sizes', default='1000,100000,1000000',
+        help='Comma separated catalog sizes, in items.')
+    parser.add_argument(
+        '--routes', default=None,
+        help='Comma separated route names, defaults to every route.')
+    parser.add_argument(
+        '--requests', type=int, default=50,
+        help='Requests made to each route.')
+    parser.add_argument(
+        '--time-limit', type=float, default=10.0, dest='timeLimit',
+        help='Seconds spent on each route before stopping early.')
+    parser.add_argument(
+        '--factor', type=float, default=3.0,
+        help='Allowed growth of a route\'s p50 latency across the sizes.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--data', default='benchmark_data',
+        help='Directory for the seeded databases.')
+    parser.add_argument('--seed-database', type=int, dest='seedSize')
+    parser.add_argument('--route', default=None)
+    args = parser.parse_args()
+
+    if args.seedSize is not None:
+        seedDatabase(args.seedSize, args.seed)
+        return
+
+    if args.route is not None:
+        result = RouteBenchmark().run(args.route, args.requests,
+                                      args.timeLimit)
+        print RESULT + json.dumps(result)
+        return
+
+    if not os.path.isdir(args.data):
+        os.makedirs(args.data)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    results = {}
+
+    for size in sizes:
+        path = os.path.abspath(
+            os.path.join(args.data, "catalog-%d-%d.db" % (size, args.seed)))
+        environment = dict(
+            os.environ, CATALOG_DATABASE_URL="sqlite:///" + path)
+
+        if not os.path.exists(path):
+            print "Seeding %d items..." % size
+            child(environment, '--seed-database', str(size), '--seed',
+                  str(args.seed))
+
+        routes = args.routes.split(',') if args.routes else ROUTES
+
+        results[size] = [
+            child(environment, '--route', route,
+                  '--requests', str(args.requests),
+                  '--time-limit', str(args.timeLimit))
+            for route in routes
+        ]
+        report(size, results[size])
+
+    if len(sizes) > 1:
+        flagged = checkScaling(min(sizes), max(sizes), results, args.factor)
+
+        print "\nScaling"
+        for line in flagged:
+            print "  " + line
+
+        if not flagged:
+            print "  No route grew with the catalog size."
+
+
+if __name__ == '__main__':
+    main()
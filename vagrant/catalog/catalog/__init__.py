@@ -1,6 +1,18 @@
 import app
+import logwriter
+import memory
+import metrics
+import cache
 import auth
+import tracing
 import urls
 import models
+import pagination
+import profiling
 import database
-import views
\ No newline at end of file
+import instrumentation
+import sampler
+import slowqueries
+import pagecache
+import views
+import xmlwriter
\ No newline at end of file
@@ -30,14 +30,124 @@ APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 APP_STATIC = os.path.join(APP_ROOT, 'static')
 APP_IMAGES = os.path.join(APP_STATIC, 'images')
 APP_CLIENT_SECRET = os.path.join(APP_ROOT, 'client_secret.json')
-APP_DATABASE = "sqlite:///catalog/catalog.db"
+APP_DATABASE = os.environ.get(
+    'CATALOG_DATABASE_URL',
+    "sqlite:///catalog/catalog.db"
+)
+DATABASE_POOL_SIZE = 5
+DATABASE_MAX_OVERFLOW = 10
+DATABASE_POOL_TIMEOUT = 30
+DATABASE_POOL_PRE_PING = True
+DATABASE_POOL_RECYCLE = 3600
+SQLITE_PERFORMANCE_PROFILE = False
+SQLITE_JOURNAL_MODE = "WAL"
+SQLITE_SYNCHRONOUS = "NORMAL"
+SQLITE_CACHE_SIZE = -32000
+SQLITE_MMAP_SIZE = 268435456
+SQLITE_TEMP_STORE = "MEMORY"
+SQLITE_BUSY_TIMEOUT = 5000
+STREAM_BATCH_SIZE = 1000
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+ADMIN_EMAILS = []
+METRICS_ENABLED = True
+QUERY_DEBUG = False
+QUERY_DEBUG_HISTORY = 100
+QUERY_BUDGET_RAISE = False
+DEFAULT_QUERY_BUDGET = 10
+SLOW_QUERY_THRESHOLD = 0.25
+SLOW_QUERY_LOG = None
+SLOW_QUERY_LOG_CAPACITY = 1000
+PROFILE_HEADER = "X-Catalog-Profile"
+PROFILE_PARAMETER = "_profile"
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_TOP = 30
+PROFILE_DIR = "catalog/profiles"
+SAMPLER_ENABLED = True
+SAMPLER_INTERVAL = 0.01
+SAMPLER_MAX_STACKS = 10000
+MEMORY_TRACKING = False
+MEMORY_HISTORY = 50
+MEMORY_TOP = 10
+MEMORY_TRACE_FRAMES = 1
+TRACING = False
+TRACE_FILE = "catalog/traces.jsonl"
+TRACE_CAPACITY = 1000
+PAGE_CACHE_ENABLED = True
+PAGE_CACHE_CAPACITY = 1000
+PAGE_CACHE_ENDPOINTS = [
+    'listItem',
+    'listCategory',
+    'listCategoryItem',
+    'viewCatItem'
+]
+QUERY_BUDGETS = {
+    'listItem': 4,
+    'listCategory': 3,
+    'listUser': 3,
+    'listCategoryItem': 4,
+    'viewCatItem': 4,
+    'viewItem': 2,
+    'viewCategory': 4,
+    'viewUser': 3,
+    'itemJSON': 3,
+    'catalogJSON': 3,
+    'catalogXML': 3
+}
 
 
 app.config['APP_IMAGES'] = APP_IMAGES
 app.config['APP_STATIC'] = APP_STATIC
 app.config['APP_ROOT'] = APP_ROOT
 app.config['APP_DATABASE'] = APP_DATABASE
+app.config['DATABASE_POOL_SIZE'] = DATABASE_POOL_SIZE
+app.config['DATABASE_MAX_OVERFLOW'] = DATABASE_MAX_OVERFLOW
+app.config['DATABASE_POOL_TIMEOUT'] = DATABASE_POOL_TIMEOUT
+app.config['DATABASE_POOL_PRE_PING'] = DATABASE_POOL_PRE_PING
+app.config['DATABASE_POOL_RECYCLE'] = DATABASE_POOL_RECYCLE
+app.config['SQLITE_PERFORMANCE_PROFILE'] = SQLITE_PERFORMANCE_PROFILE
+app.config['SQLITE_JOURNAL_MODE'] = SQLITE_JOURNAL_MODE
+app.config['SQLITE_SYNCHRONOUS'] = SQLITE_SYNCHRONOUS
+app.config['SQLITE_CACHE_SIZE'] = SQLITE_CACHE_SIZE
+app.config['SQLITE_MMAP_SIZE'] = SQLITE_MMAP_SIZE
+app.config['SQLITE_TEMP_STORE'] = SQLITE_TEMP_STORE
+app.config['SQLITE_BUSY_TIMEOUT'] = SQLITE_BUSY_TIMEOUT
+app.config['STREAM_BATCH_SIZE'] = STREAM_BATCH_SIZE
+app.config['PAGE_SIZE'] = PAGE_SIZE
+app.config['MAX_PAGE_SIZE'] = MAX_PAGE_SIZE
+app.config['ADMIN_EMAILS'] = ADMIN_EMAILS
+app.config['METRICS_ENABLED'] = METRICS_ENABLED
+app.config['QUERY_DEBUG'] = QUERY_DEBUG
+app.config['QUERY_DEBUG_HISTORY'] = QUERY_DEBUG_HISTORY
+app.config['QUERY_BUDGET_RAISE'] = QUERY_BUDGET_RAISE
+app.config['DEFAULT_QUERY_BUDGET'] = DEFAULT_QUERY_BUDGET
+app.config['QUERY_BUDGETS'] = QUERY_BUDGETS
+app.config['SLOW_QUERY_THRESHOLD'] = SLOW_QUERY_THRESHOLD
+app.config['SLOW_QUERY_LOG'] = SLOW_QUERY_LOG
+app.config['SLOW_QUERY_LOG_CAPACITY'] = SLOW_QUERY_LOG_CAPACITY
+app.config['PROFILE_HEADER'] = PROFILE_HEADER
+app.config['PROFILE_PARAMETER'] = PROFILE_PARAMETER
+app.config['PROFILE_TOKEN_MAX_AGE'] = PROFILE_TOKEN_MAX_AGE
+app.config['PROFILE_TOP'] = PROFILE_TOP
+app.config['PROFILE_DIR'] = PROFILE_DIR
+app.config['SAMPLER_ENABLED'] = SAMPLER_ENABLED
+app.config['SAMPLER_INTERVAL'] = SAMPLER_INTERVAL
+app.config['SAMPLER_MAX_STACKS'] = SAMPLER_MAX_STACKS
+app.config['MEMORY_TRACKING'] = MEMORY_TRACKING
+app.config['MEMORY_HISTORY'] = MEMORY_HISTORY
+app.config['MEMORY_TOP'] = MEMORY_TOP
+app.config['MEMORY_TRACE_FRAMES'] = MEMORY_TRACE_FRAMES
+app.config['TRACING'] = TRACING
+app.config['TRACE_FILE'] = TRACE_FILE
+app.config['TRACE_CAPACITY'] = TRACE_CAPACITY
+app.config['PAGE_CACHE_ENABLED'] = PAGE_CACHE_ENABLED
+app.config['PAGE_CACHE_CAPACITY'] = PAGE_CACHE_CAPACITY
+app.config['PAGE_CACHE_ENDPOINTS'] = PAGE_CACHE_ENDPOINTS
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
 app.config['APP_CLIENT_SECRET'] = APP_CLIENT_SECRET
 app.json_encoder = ModelsEncoder
+
+# Override any of the above from the file named by the CATALOG_SETTINGS
+# environment variable.
+app.config.from_envvar('CATALOG_SETTINGS', silent=True)
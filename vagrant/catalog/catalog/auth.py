@@ -213,6 +213,25 @@ def isActiveSession():
         return True
 
 
+def isAdminSession():
+    """Determine if the user currently logged in is one of the app's
+    administrators.
+
+    Note:
+        Administrators are listed by email address in the ADMIN_EMAILS
+        setting.
+
+    Returns:
+        True if the session is active and its email address is listed,
+        otherwise False.
+
+    """
+    if isActiveSession() is False:
+        return False
+
+    return login_session.get('email') in app.config['ADMIN_EMAILS']
+
+
 def canAlter(userID):
     """Confirms that the user specified by the given user id is the one currently
     in the login_session.
@@ -331,7 +350,9 @@ def ConnectGoogle(request):
 
     # Make sure that the session state in the request matches the current state
     # for this login session.
-    if request.args.get('state') != login_session['state']:
+    state = login_session.get('state')
+
+    if state is None or request.args.get('state') != state:
         return createResponse('Invalid state parameter.', 401)
 
     # Code required for obtaining credentials via OAuth
@@ -0,0 +1,377 @@
+'''
+This is the cache module for the Catalog app.
+The module provides version counters for the data in the Catalog and caches
+of values derived from that data, which are reloaded whenever the version
+they were loaded at changes.
+
+The caches are process wide, but the versions are kept in the database.
+A SharedVersion is bumped by any change to the models it tracks, made by any
+process, so every process sees it and reloads its caches.
+
+Attributes:
+    categoryVersion (SharedVersion): Bumped whenever a Category is created,
+        changed or deleted.
+    catalogVersion (SharedVersion): Bumped whenever a User, Category or Item
+        is created, changed or deleted.
+    userVersion (SharedVersion): Bumped whenever a User is created, changed
+        or deleted.
+    fragmentCache (FragmentCache):  The app's rendered blocks of HTML, such as
+        the sidebar's list of Categories.
+
+'''
+import time
+from calendar import timegm
+from datetime import date, datetime
+
+from flask import g, has_request_context
+from sqlalchemy import Column, DateTime, Integer, String, event
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app
+from database import Base, session
+from metrics import increment
+
+class Counter(Base):
+    '''The value of a SharedVersion, kept in the database.
+
+    Attributes:
+        name (string):      The name of the SharedVersion.
+        value (integer):    The number of times it has been bumped.
+        modified (datetime): The UTC time it was last bumped, or created.
+    '''
+    __tablename__ = "counter"
+
+    name = Column(String(40), primary_key=True)
+    value = Column(Integer, nullable=False)
+    modified = Column(DateTime, nullable=False)
+
+
+# Every SharedVersion, in the order they were created.
+sharedVersions = []
+
+
+def readCounters():
+    '''The value of every Counter, read once for each request.
+
+    Notes:
+        Outside of a request the Counters are read on each call.
+
+    Returns:
+        dict: The value of each Counter and the time it was modified, in
+            seconds since the epoch, by the Counter's name.
+    '''
+    inRequest = has_request_context()
+
+    if inRequest and 'counters' in g:
+        return g.counters
+
+    counters = dict(
+        (name, (value, timegm(modified.timetuple()) +
+                modified.microsecond / 1000000.0))
+        for name, value, modified in session.query(
+            Counter.name,
+            Counter.value,
+            Counter.modified
+        )
+    )
+
+    if inRequest:
+        g.counters = counters
+
+    return counters
+
+
+class SharedVersion(object):
+    '''A counter kept in the database, so that every process using the
+    database sees it bumped.
+
+    Notes:
+        The time it was last bumped is part of its value, so a database
+        that was recreated isn't mistaken for the one it replaced when its
+        counters catch up.
+
+        A request reads every SharedVersion in a single query, the first
+        time it needs one, and sees the same values until it commits.  Any
+        flush of the app's session that creates, changes or deletes an
+        instance of a model the version tracks bumps it once the session's
+        transaction commits, in a short transaction of its own.  The change
+        isn't held up waiting for the Counter's row, which every writer
+        updates, and a value read between the commit and the bump is only
+        cached under the old version, so it is replaced once the bump
+        lands.  Changes made without the models must bump it themselves,
+        with bumpTracking.
+
+    Args:
+        name (string):  The name of the version's Counter.
+
+    Attributes:
+        models (tuple): The models whose changes bump the version.
+        value (tuple):  The number of times it was bumped and the time of
+            the last bump.
+        modified (float): The time it was last bumped.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.models = ()
+        sharedVersions.append(self)
+
+    def track(self, *models):
+        '''Bump the version whenever an instance of one of the models is
+        created, changed or deleted.'''
+        self.models = models
+
+    @property
+    def value(self):
+        return readCounters().get(self.name, (0, 0.0))
+
+    @property
+    def modified(self):
+        return self.value[1]
+
+    def bump(self, connection):
+        '''Advance the version in a connection's transaction.
+
+        Notes:
+            The change is seen by other requests once the transaction is
+            committed.
+
+        Args:
+            connection (Connection): The connection to bump the version
+                with.
+        '''
+        table = Counter.__table__
+        now = datetime.utcnow()
+
+        bumped = connection.execute(
+            table.update().where(table.c.name == self.name).values(
+                value=table.c.value + 1,
+                modified=now
+            )
+        )
+
+        if bumped.rowcount == 0:
+            connection.execute(
+                table.insert().values(name=self.name, value=1, modified=now)
+            )
+
+    def validators(self):
+        '''Describe the current version for HTTP conditional requests.
+
+        Notes:
+            Last-Modified is only precise to the second, so it isn't given
+            until the second of the last change has passed.  Otherwise a
+            client could be sent the same date before and after another
+            change made within that second.
+
+        Returns:
+            tuple: A tag unique to the version, the same in every process,
+                for an ETag, and the UTC datetime of the last change, to the
+                second, for a Last-Modified header, or None.
+        '''
+        value, modified = self.value
+        lastModified = None
+
+        if int(modified) < int(time.time()):
+            lastModified = datetime.utcfromtimestamp(int(modified))
+
+        return ("%d-%x" % (value, int(modified * 1000000)), lastModified)
+
+
+def bumpTracking(models, dbSession=session):
+    '''Bump every SharedVersion that tracks any of the models, once the
+    session's transaction commits.
+
+    Args:
+        models (iterable):  The models of the instances that were changed.
+        dbSession (Session): The session that changed them.
+    '''
+    models = set(models)
+    pending = dbSession.info.setdefault('bumpVersions', set())
+
+    for version in sharedVersions:
+        if models.intersection(version.models):
+            pending.add(version)
+
+
+@event.listens_for(Counter.__table__, 'after_create')
+def createCounters(table, connection, **kw):
+    '''Start every SharedVersion's Counter with the table.'''
+    now = datetime.utcnow()
+    connection.execute(
+        table.insert(),
+        [{'name': v.name, 'value': 0, 'modified': now} for v in sharedVersions]
+    )
+
+
+@event.listens_for(session, 'before_flush')
+def bumpChangedVersions(dbSession, context, instances):
+    '''Bump the SharedVersions that track the instances being flushed,
+    once they are committed.'''
+    changed = set(type(i) for i in dbSession.new)
+    changed.update(type(i) for i in dbSession.deleted)
+    changed.update(
+        type(i) for i in dbSession.dirty
+        if dbSession.is_modified(i, include_collections=False)
+    )
+
+    if changed:
+        bumpTracking(changed, dbSession)
+
+
+@event.listens_for(session, 'after_commit')
+def bumpCommittedVersions(dbSession):
+    '''Bump the SharedVersions that track the committed changes.
+
+    Notes:
+        The versions are bumped in the order they were created, so two
+        transactions bumping the same versions lock their rows in the same
+        order and can't deadlock.  The changes are already committed when
+        a bump fails, so the failure is logged rather than raised, and
+        caches of the changed data are refreshed by the next change that is
+        counted.
+    '''
+    pending = dbSession.info.pop('bumpVersions', None)
+
+    if not pending:
+        return
+
+    try:
+        with dbSession.get_bind().begin() as connection:
+            for version in sharedVersions:
+                if version in pending:
+                    version.bump(connection)
+
+    except SQLAlchemyError:
+        app.logger.exception(
+            "Bumping the versions %s failed",
+            ", ".join(v.name for v in sharedVersions if v in pending)
+        )
+
+
+@event.listens_for(session, 'after_rollback')
+def forgetChangedVersions(dbSession):
+    '''Don't bump the SharedVersions of changes that were rolled back.'''
+    dbSession.info.pop('bumpVersions', None)
+
+
+@event.listens_for(session, 'after_commit')
+def forgetCounters(dbSession):
+    '''Read the Counters again after a request commits its changes.'''
+    if has_request_context():
+        g.pop('counters', None)
+
+
+class DailyVersion(object):
+    '''A SharedVersion combined with the current date, for values that also
+    change when the day rolls over.
+
+    Args:
+        version (SharedVersion): The version of the data the values derive
+            from.
+
+    Attributes:
+        value (tuple):  The version's value and today's date.
+    '''
+
+    def __init__(self, version):
+        self._version = version
+
+    @property
+    def value(self):
+        return (self._version.value, date.today())
+
+
+class VersionedCache(object):
+    '''Cache a single value until the version it was loaded at changes.
+
+    Notes:
+        The version is read before the value is loaded.  If the version is
+        bumped while the value is loading, the value is stored under the
+        older version and is loaded again on the next call to get.
+
+        Each call to get is counted as a hit or a miss in the
+        catalog_cache_requests_total metric.
+
+    Args:
+        version (SharedVersion): The version of the data the value derives
+            from, or anything else with a value that changes when it does.
+        load (function):    Called without arguments to load the value.
+        name (string):      Identifies the cache in the app's metrics.
+    '''
+
+    def __init__(self, version, load, name):
+        self._version = version
+        self._load = load
+        self._entry = None
+        self.name = name
+
+    def get(self):
+        '''The cached value, loading it first if the version has changed.
+
+        Returns:
+            The value returned by load for the current version.
+        '''
+        version = self._version.value
+        entry = self._entry
+
+        if entry is None or entry[0] != version:
+            increment('catalog_cache_requests_total', (self.name, 'miss'))
+            entry = (version, self._load())
+            self._entry = entry
+        else:
+            increment('catalog_cache_requests_total', (self.name, 'hit'))
+
+        return entry[1]
+
+    def clear(self):
+        '''Discard the cached value.'''
+        self._entry = None
+
+
+class FragmentCache(object):
+    '''Cache rendered blocks of HTML, each until the version it was rendered
+    at changes.
+
+    Notes:
+        A fragment is registered once, with the SharedVersion of the data it
+        shows and a function that renders it.  Each fragment is counted in the
+        catalog_cache_requests_total metric under its own name.
+    '''
+
+    def __init__(self):
+        self._fragments = {}
+
+    def register(self, name, version, render):
+        '''Register a fragment.
+
+        Args:
+            name (string):      Identifies the fragment.
+            version (SharedVersion): The version of the data the fragment
+                shows.
+            render (function):  Called without arguments to render the
+                fragment's HTML.
+        '''
+        self._fragments[name] = VersionedCache(version, render, name)
+
+    def render(self, name):
+        '''The HTML of a fragment, rendered first if its version has changed.
+
+        Args:
+            name (string): The name the fragment was registered with.
+
+        Returns:
+            string: The fragment's HTML.
+        '''
+        return self._fragments[name].get()
+
+    def clear(self):
+        '''Discard every rendered fragment.'''
+        for fragment in self._fragments.values():
+            fragment.clear()
+
+
+categoryVersion = SharedVersion('category')
+catalogVersion = SharedVersion('catalog')
+userVersion = SharedVersion('user')
+fragmentCache = FragmentCache()
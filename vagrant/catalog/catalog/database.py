@@ -3,7 +3,9 @@ This is the database module for the Catalog app.
 The module provides a method for initialzing the database connection/session.
 
 Attributes:
-    engine:     The SQLAlchemy connection to the app's database.
+    engine:     The SQLAlchemy connection to the app's database.  Its url and
+        connection pool are set by the app's configuration.
+        (see engineOptions)
 
     DBSession:  The SQLAlchemy database session for making queries against
         the models and data conatined in the database.
@@ -16,7 +18,10 @@ Attributes:
     app:        The Flask App instance, provides the Database directive.
 '''
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, select
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy.orm import (
     scoped_session,
     sessionmaker
@@ -24,7 +29,96 @@ from sqlalchemy.orm import (
 
 from app import app
 
-engine = create_engine(app.config['APP_DATABASE'])
+
+def engineOptions(config):
+    '''The options used to create the engine for the app's database.
+
+    Notes:
+        Connections are pooled for both SQLite and PostgreSQL databases, with
+        the size, overflow, timeout, pre-ping and recycle time of the pool
+        taken from the configuration.
+
+        An SQLite database file is pooled with a QueuePool, which hands each
+        connection to one thread at a time, so the connections are allowed
+        to move between the threads of the server.  An in memory SQLite
+        database keeps its default pool, one connection for each thread.
+
+    Args:
+        config (Config): The app's configuration.
+
+    Returns:
+        dict: The keyword arguments for create_engine.
+    '''
+    url = make_url(config['APP_DATABASE'])
+
+    options = {
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE']
+    }
+
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return options
+
+        options['poolclass'] = QueuePool
+        options['connect_args'] = {'check_same_thread': False}
+
+    options['pool_size'] = config['DATABASE_POOL_SIZE']
+    options['max_overflow'] = config['DATABASE_MAX_OVERFLOW']
+    options['pool_timeout'] = config['DATABASE_POOL_TIMEOUT']
+
+    return options
+
+
+def sqlitePragmas(config):
+    '''The PRAGMA statements of the SQLite performance profile.
+
+    Notes:
+        Write-ahead logging lets readers continue while a write is being
+        committed, and with it synchronous=NORMAL only syncs the log at
+        checkpoints.  The page cache size is in pages, or KiB when
+        negative, the memory map size in bytes and the busy timeout in
+        milliseconds.
+
+    Args:
+        config (Config): The app's configuration.
+
+    Returns:
+        list: The statements to execute on each new connection.
+    '''
+    return [
+        "PRAGMA journal_mode=%s" % config['SQLITE_JOURNAL_MODE'],
+        "PRAGMA synchronous=%s" % config['SQLITE_SYNCHRONOUS'],
+        "PRAGMA cache_size=%d" % config['SQLITE_CACHE_SIZE'],
+        "PRAGMA mmap_size=%d" % config['SQLITE_MMAP_SIZE'],
+        "PRAGMA temp_store=%s" % config['SQLITE_TEMP_STORE'],
+        "PRAGMA busy_timeout=%d" % config['SQLITE_BUSY_TIMEOUT']
+    ]
+
+
+def applySQLiteProfile(dbapi_connection, connection_record):
+    '''Apply the SQLite performance profile to a new connection.
+
+    Notes:
+        Listens for the engine's connect event when the
+        SQLITE_PERFORMANCE_PROFILE setting is enabled.
+    '''
+    cursor = dbapi_connection.cursor()
+
+    for pragma in sqlitePragmas(app.config):
+        cursor.execute(pragma)
+
+    cursor.close()
+
+
+engine = create_engine(
+    app.config['APP_DATABASE'],
+    **engineOptions(app.config)
+)
+
+if engine.dialect.name == 'sqlite' and \
+        app.config['SQLITE_PERFORMANCE_PROFILE']:
+    event.listen(engine, 'connect', applySQLiteProfile)
 
 DBSession = sessionmaker(
     autocommit=False,
@@ -42,3 +136,176 @@ def init_db():
     '''Initialize the Database.'''
     # Generate the Database, if necessary, and connect to it.
     Base.metadata.create_all(bind=engine)
+
+
+def addColumnDDL(table, column):
+    '''Build the ALTER TABLE statement that adds a column to a table.
+
+    Args:
+        table (Table):      The table.
+        column (Column):    The column, as declared by the model.
+
+    Returns:
+        string: The statement.
+    '''
+    preparer = engine.dialect.identifier_preparer
+    ddl = "ALTER TABLE %s ADD COLUMN %s %s" % (
+        preparer.format_table(table),
+        preparer.format_column(column),
+        column.type.compile(dialect=engine.dialect)
+    )
+
+    if column.server_default is not None:
+        ddl += " DEFAULT %s" % column.server_default.arg
+
+    if not column.nullable:
+        ddl += " NOT NULL"
+
+    return ddl
+
+
+def duplicateValues(table, columns):
+    '''Find the values that more than one row of a table has in a set of
+    columns, which prevent a unique index on the columns being created.
+
+    Args:
+        table (Table):      The table.
+        columns (list):     The names of the columns.
+
+    Returns:
+        list: A row of the duplicated values and the number of rows that
+            have them, for each set of values.
+    '''
+    keys = [table.c[name] for name in columns]
+    return engine.execute(
+        select(keys + [func.count()]).group_by(*keys).having(func.count() > 1)
+    ).fetchall()
+
+
+def migrate_db():
+    '''Add the columns, indexes and unique constraints declared by the models
+    that an existing database is missing.
+
+    Notes:
+        create_all only creates missing tables, so the columns and indexes
+        added to the models after a database was created are created here.
+        A column added to a table with rows needs a server default when it
+        can't be NULL, which fills it in for the existing rows.
+
+        SQLite can't add a constraint to an existing table, so a missing
+        unique constraint is added as a unique index with the same name and
+        columns.
+
+        A database created before a unique index was declared may have rows
+        that break it.  Every missing unique index is checked before the
+        database is changed, and one that can't be created is skipped and
+        the duplicated values are logged, so they can be removed and the
+        index created when the app is next started.
+
+    Returns:
+        list: The names of the columns, as table.column, and of the indexes
+            that were created.
+    '''
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    missing = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+
+        columns = set(c['name'] for c in inspector.get_columns(table.name))
+
+        existing = set(i['name'] for i in inspector.get_indexes(table.name))
+        existing.update(
+            c['name'] for c in inspector.get_unique_constraints(table.name)
+        )
+
+        indexes = [i for i in table.indexes if i.name not in existing]
+        constraints = [
+            c for c in table.constraints
+            if isinstance(c, UniqueConstraint) and
+            c.name and c.name not in existing
+        ]
+
+        missing.append((
+            table,
+            [c for c in table.columns if c.name not in columns],
+            indexes,
+            constraints
+        ))
+
+    # Look for rows that break a unique index before making any changes, so
+    # the database isn't left partly migrated.
+    skipped = set()
+
+    for table, columns, indexes, constraints in missing:
+        unique = [i for i in indexes if i.unique] + constraints
+
+        for index in unique:
+            names = [c.name for c in index.columns]
+
+            # A column that is still to be added has no duplicates to find.
+            if any(c.name in names for c in columns):
+                continue
+
+            duplicates = duplicateValues(table, names)
+
+            if duplicates:
+                skipped.add(index.name)
+                app.logger.warning(
+                    "Not creating the unique index %s on %s (%s): %d sets "
+                    "of values are shared by more than one row, such as %s. "
+                    "Remove the duplicates and restart the app to create it.",
+                    index.name,
+                    table.name,
+                    ", ".join(names),
+                    len(duplicates),
+                    ", ".join(repr(tuple(d[:-1])) for d in duplicates[:5])
+                )
+
+    created = []
+
+    for table, columns, indexes, constraints in missing:
+        for column in columns:
+            engine.execute(addColumnDDL(table, column))
+            created.append("%s.%s" % (table.name, column.name))
+
+        for index in indexes:
+            if index.name not in skipped:
+                index.create(bind=engine)
+                created.append(index.name)
+
+        for constraint in constraints:
+            if constraint.name not in skipped:
+                engine.execute("CREATE UNIQUE INDEX %s ON %s (%s)" % (
+                    constraint.name,
+                    table.name,
+                    ", ".join(c.name for c in constraint.columns)
+                ))
+                created.append(constraint.name)
+
+    return created
+
+
+def explain(statement, parameters=()):
+    '''Retrieve the database's query plan for an SQL statement.
+
+    Notes:
+        SQLite describes its plan with EXPLAIN QUERY PLAN, other databases
+        (i.e. PostgreSQL) with EXPLAIN.
+
+    Args:
+        statement (string): The SQL statement, using the engine's
+            parameter style.
+        parameters (tuple or dict): The statement's bound parameters.
+
+    Returns:
+        list: The lines of the query plan.
+    '''
+    if engine.dialect.name == 'sqlite':
+        rows = engine.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return [row[-1] for row in rows]
+
+    rows = engine.execute("EXPLAIN " + statement, parameters)
+    return [row[0] for row in rows]
@@ -0,0 +1,251 @@
+'''
+This is the instrumentation module for the Catalog app.
+The module counts and times the SQL statements executed for each request
+made to the app.
+
+Every statement executed through the database engine is timed with the
+engine's cursor execute events.  While a request is being handled the
+statements are added to its QueryStats, which are:
+
+    Reported to the client in a Server-Timing header.
+    Kept for the most recent requests, for the debug endpoint.
+    Checked against the request's query budget.
+
+Statements slower than SLOW_QUERY_THRESHOLD are also passed on to the slow
+query log, whether or not they were executed for a request.  Refer to
+:py:mod:`~slowqueries`.
+
+The statements a streamed response executes while its body is written are
+counted once the response is finished, so they are not included in its
+Server-Timing header but are included in the other two.
+
+Attributes:
+    recentRequests (deque): The QueryStats of the most recent requests,
+        oldest first.  The number kept is set by QUERY_DEBUG_HISTORY.
+
+'''
+import time
+from collections import deque
+from threading import Lock
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from app import app
+from database import engine
+from slowqueries import slowQueryLog
+
+
+class QueryBudgetExceeded(Exception):
+    '''A request executed more SQL statements than its route's budget.'''
+
+
+class QueryStats(object):
+    '''The SQL statements executed for a single request.
+
+    Attributes:
+        method (string):    The request's HTTP method.
+        path (string):      The request's path.
+        endpoint (string):  The route that handled the request, or None.
+        started (float):    The time the request was received.
+        duration (float):   Seconds spent handling the request, or None
+            until it is finished.
+        count (int):        The number of statements executed.
+        time (float):       Seconds spent executing the statements.
+        slowest (string):   The slowest statement, or None.
+        slowestTime (float): Seconds spent executing the slowest statement.
+        budgetChecked (Boolean): The query budget has been checked.
+    '''
+
+    def __init__(self, method, path, endpoint):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.duration = None
+        self.count = 0
+        self.time = 0.0
+        self.slowest = None
+        self.slowestTime = 0.0
+        self.budgetChecked = False
+
+    def record(self, statement, elapsed):
+        '''Add an executed statement.
+
+        Args:
+            statement (string): The SQL statement.
+            elapsed (float):    Seconds spent executing it.
+        '''
+        self.count += 1
+        self.time += elapsed
+
+        if self.slowest is None or elapsed > self.slowestTime:
+            self.slowest = statement
+            self.slowestTime = elapsed
+
+    @property
+    def serialize(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'duration': self.duration,
+            'queries': self.count,
+            'queryTime': self.time,
+            'slowest': self.slowest,
+            'slowestTime': self.slowestTime
+        }
+
+
+recentRequests = deque(maxlen=app.config['QUERY_DEBUG_HISTORY'])
+_recentLock = Lock()
+
+
+def currentStats():
+    '''The QueryStats of the request being handled.
+
+    Returns:
+        QueryStats: The request's stats, or None outside of a request.
+    '''
+    if not has_request_context():
+        return None
+
+    return g.get('queryStats')
+
+
+def queryBudget(endpoint):
+    '''The most SQL statements a request to a route may execute.
+
+    Notes:
+        Budgets are set for each route by QUERY_BUDGETS, and for the
+        remaining routes by DEFAULT_QUERY_BUDGET.
+
+    Args:
+        endpoint (string): The name of the route.
+
+    Returns:
+        int: The route's budget, or None if the route has no budget.
+    '''
+    return app.config['QUERY_BUDGETS'].get(
+        endpoint,
+        app.config['DEFAULT_QUERY_BUDGET']
+    )
+
+
+def serverTiming(stats):
+    '''Describe a request's SQL statements as a Server-Timing header.
+
+    Args:
+        stats (QueryStats): The request's stats.
+
+    Returns:
+        string: The header's value, with durations in milliseconds.
+    '''
+    return 'db;desc="%d queries";dur=%.2f, db-slowest;dur=%.2f, ' \
+        'app;dur=%.2f' % (
+            stats.count,
+            stats.time * 1000,
+            stats.slowestTime * 1000,
+            (time.time() - stats.started) * 1000
+        )
+
+
+@event.listens_for(engine, 'before_cursor_execute')
+def startQuery(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('queryStart', []).append(time.time())
+
+
+@event.listens_for(engine, 'after_cursor_execute')
+def finishQuery(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.time() - conn.info['queryStart'].pop()
+    stats = currentStats()
+
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+    slowQueryLog.record(statement, parameters, elapsed, executemany)
+
+
+@app.before_request
+def startRequestStats():
+    g.queryStats = QueryStats(
+        request.method,
+        request.path,
+        request.endpoint
+    )
+
+
+def checkQueryBudget(stats, canRaise):
+    '''Check a request's statements against its route's query budget.
+
+    Args:
+        stats (QueryStats): The request's stats.
+        canRaise (Boolean): The request can still fail.  A streamed
+            response has been sent before its budget is checked.
+
+    Raises:
+        QueryBudgetExceeded: The request went over its budget, it can still
+            fail and QUERY_BUDGET_RAISE is set, as it should be when
+            testing.  Otherwise going over the budget is logged.
+    '''
+    budget = queryBudget(stats.endpoint)
+
+    if budget is None or stats.count <= budget:
+        return
+
+    message = "%s %s executed %d queries, over the %s budget of %d" % (
+        stats.method,
+        stats.path,
+        stats.count,
+        stats.endpoint,
+        budget
+    )
+
+    if canRaise and app.config['QUERY_BUDGET_RAISE']:
+        raise QueryBudgetExceeded(message)
+
+    app.logger.warning(message)
+
+
+@app.after_request
+def finishResponseStats(response):
+    '''Add the Server-Timing header and, unless the response is streamed,
+    check the request's query budget.'''
+    stats = currentStats()
+
+    if stats is None:
+        return response
+
+    response.headers['Server-Timing'] = serverTiming(stats)
+
+    if not response.is_streamed:
+        stats.budgetChecked = True
+        checkQueryBudget(stats, True)
+
+    return response
+
+
+@app.teardown_request
+def finishRequestStats(exc):
+    '''Keep the finished request's stats and check the query budget of a
+    streamed response.'''
+    stats = g.get('queryStats')
+
+    if stats is None:
+        return
+
+    stats.duration = time.time() - stats.started
+
+    with _recentLock:
+        recentRequests.append(stats)
+
+    if not stats.budgetChecked:
+        checkQueryBudget(stats, False)
+
+
+def recentRequestStats():
+    '''The serialized stats of the most recent requests, newest first.'''
+    with _recentLock:
+        stats = list(recentRequests)
+
+    return [s.serialize for s in reversed(stats)]
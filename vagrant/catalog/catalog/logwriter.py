@@ -0,0 +1,109 @@
+'''
+This is the log writer module for the Catalog app.
+The module writes the app's diagnostic logs, such as the slow query log and
+the trace log, from a background thread, so a request never waits for its
+entries to be written.
+
+'''
+from Queue import Queue, Empty, Full
+from threading import Lock, Thread
+
+from app import app
+
+
+class BufferedLogWriter(object):
+    '''Write lines to a log from a background thread.
+
+    Notes:
+        The thread is started by the first write.  It writes the lines in
+        batches, flushing after each batch.
+
+    Args:
+        path (string):      The file the lines are appended to, or None to
+            write them to the app's logger.
+        capacity (int):     The most entries waiting to be written.
+        prepare (function): Called by the thread with each queued entry,
+            returns the line to write.
+        name (string):      Names the thread and prefixes the lines written
+            to the app's logger.
+        written (function): Called by the thread with each batch of entries
+            once their lines have been written, or None.
+
+    Attributes:
+        dropped (int):  The number of entries discarded because the queue was
+            full.
+    '''
+
+    def __init__(self, path, capacity, prepare, name, written=None):
+        self.path = path
+        self.prepare = prepare
+        self.name = name
+        self.written = written
+        self.dropped = 0
+        self._queue = Queue(capacity)
+        self._thread = None
+        self._lock = Lock()
+
+    def write(self, entry):
+        '''Queue an entry without waiting.
+
+        Returns:
+            True if the entry was queued, False if it was dropped.
+        '''
+        if self._thread is None:
+            self._start()
+
+        try:
+            self._queue.put_nowait(entry)
+
+        except Full:
+            with self._lock:
+                self.dropped += 1
+
+            return False
+
+        return True
+
+    def flush(self):
+        '''Wait until every queued entry has been written.'''
+        self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+
+            except Empty:
+                pass
+
+            try:
+                self._writeLines([self.prepare(entry) for entry in batch])
+
+                if self.written is not None:
+                    self.written(batch)
+
+            except Exception:
+                app.logger.exception("Writing the %s log failed", self.name)
+
+            finally:
+                for entry in batch:
+                    self._queue.task_done()
+
+    def _writeLines(self, lines):
+        if self.path is None:
+            for line in lines:
+                app.logger.warning("%s: %s", self.name, line)
+            return
+
+        with open(self.path, 'a') as log:
+            log.write(''.join(line + '\n' for line in lines))
@@ -0,0 +1,182 @@
+'''
+This is the memory module for the Catalog app.
+The module measures the memory allocated by requests, when MEMORY_TRACKING
+is set.
+
+Allocations are traced with tracemalloc, which is part of the standard
+library from Python 3.4 and is provided for Python 2.7 by the pytracemalloc
+package.  Tracing is process wide, so one request at a time is measured: a
+request that arrives while another is being measured is passed over rather
+than made to wait.  For each measured request the following are recorded:
+
+    peak:   The most memory allocated while the request was handled.
+    net:    The memory allocated during the request that is still allocated
+        once it is finished, after the database session is removed.
+    sites:  The MEMORY_TOP file and line numbers with the most net memory.
+    rss:    The growth of the process's peak resident set size.
+
+A request is finished once its response, including a streamed body, has
+been written and its app context torn down, so memory held by the scoped
+session is counted as net memory only if removing the session leaks it.
+
+Without tracemalloc only the growth of the resident set size is recorded.
+Allocations of other threads while a request is measured are counted
+against it, so the measurements are most precise under light load.
+
+Attributes:
+    memoryTracker (MemoryTracker): The app's tracker.
+
+'''
+import resource
+import time
+from collections import deque
+from threading import Lock
+
+from flask import g, request
+
+from app import app
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def peakRSS():
+    '''The process's peak resident set size, in KiB on Linux.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class MemoryTracker(object):
+    '''Measure the memory allocated by one request at a time.
+
+    Args:
+        history (int):  The number of recent measurements kept.
+        top (int):      The number of allocation sites kept for each one.
+        frames (int):   The number of frames tracemalloc stores for each
+            allocation.
+
+    Attributes:
+        recent (deque):     The most recent measurements, oldest first.
+        endpoints (dict):   Totals for the measured requests to each route.
+        skipped (int):      Requests not measured because another request
+            was being measured.
+    '''
+
+    def __init__(self, history, top, frames):
+        self.top = top
+        self.frames = frames
+        self.recent = deque(maxlen=history)
+        self.endpoints = {}
+        self.skipped = 0
+        self._measuring = Lock()
+        self._lock = Lock()
+
+    def begin(self):
+        '''Start measuring the current request, if no other request is being
+        measured.
+
+        Returns:
+            True if the request is being measured.
+        '''
+        if not self._measuring.acquire(False):
+            self.skipped += 1
+            return False
+
+        # Leave tracing that was started elsewhere, such as by the
+        # PYTHONTRACEMALLOC environment variable, alone.
+        tracing = tracemalloc is not None and not tracemalloc.is_tracing()
+
+        if tracing:
+            tracemalloc.start(self.frames)
+
+        g.memoryStart = (request.method, request.path, request.endpoint,
+                         time.time(), peakRSS(), tracing)
+        return True
+
+    def finish(self):
+        '''Finish measuring the current request and record the results.'''
+        method, path, endpoint, started, rss, tracing = g.pop('memoryStart')
+
+        entry = {
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'time': started,
+            'rss': (peakRSS() - rss) * 1024,
+            'peak': None,
+            'net': None,
+            'sites': []
+        }
+
+        try:
+            if tracing:
+                net, peak = tracemalloc.get_traced_memory()
+                stats = tracemalloc.take_snapshot().statistics('lineno')
+
+                entry['peak'] = peak
+                entry['net'] = net
+                entry['sites'] = [
+                    {
+                        'site': "%s:%d" % (
+                            stat.traceback[0].filename,
+                            stat.traceback[0].lineno
+                        ),
+                        'size': stat.size,
+                        'count': stat.count
+                    } for stat in stats[:self.top]
+                ]
+
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+            self._measuring.release()
+
+        with self._lock:
+            self.recent.append(entry)
+            totals = self.endpoints.setdefault(endpoint, {
+                'requests': 0,
+                'maxPeak': 0,
+                'totalNet': 0,
+                'totalRSS': 0
+            })
+            totals['requests'] += 1
+            totals['maxPeak'] = max(totals['maxPeak'], entry['peak'] or 0)
+            totals['totalNet'] += entry['net'] or 0
+            totals['totalRSS'] += entry['rss']
+
+    @property
+    def serialize(self):
+        with self._lock:
+            recent = list(reversed(self.recent))
+            endpoints = dict(
+                (endpoint, dict(totals))
+                for endpoint, totals in self.endpoints.items()
+            )
+
+        return {
+            'tracemalloc': tracemalloc is not None,
+            'skipped': self.skipped,
+            'endpoints': endpoints,
+            'recent': recent
+        }
+
+
+memoryTracker = MemoryTracker(
+    app.config['MEMORY_HISTORY'],
+    app.config['MEMORY_TOP'],
+    app.config['MEMORY_TRACE_FRAMES']
+)
+
+
+@app.before_request
+def beginMemoryTracking():
+    if app.config['MEMORY_TRACKING']:
+        memoryTracker.begin()
+
+
+@app.teardown_appcontext
+def finishMemoryTracking(exc):
+    if 'memoryStart' in g:
+        memoryTracker.finish()
@@ -0,0 +1,359 @@
+'''
+This is the metrics module for the Catalog app.
+The module collects counters and histograms about the requests made to the
+app and exports them in the Prometheus text format.
+
+Every request to a route adds to:
+
+    catalog_requests_total              by route, method and status code.
+    catalog_request_duration_seconds    a histogram by route and method.
+    catalog_response_size_bytes         a histogram by route.
+    catalog_db_queries_total            by route.
+    catalog_db_query_seconds_total      by route.
+
+The caches in the cache module count their hits and misses, and the state of
+the database engine's connection pool is read when the metrics are exported.
+
+Each thread adds to its own shard of the metrics, so recording a value never
+waits on a lock.  The shards are only merged when the metrics are exported,
+and the shards of threads that have finished are folded into a single
+retired shard at that point.
+
+Attributes:
+    METRICS (dict):     The type, help text and label names of each metric.
+    BUCKETS (dict):     The upper bounds of the buckets of each histogram.
+
+'''
+import bisect
+import threading
+import time
+
+from flask import g, request
+
+from app import app
+
+METRICS = {
+    'catalog_requests_total': (
+        'counter',
+        'Requests handled.',
+        ('endpoint', 'method', 'status')
+    ),
+    'catalog_request_duration_seconds': (
+        'histogram',
+        'Time spent handling a request, including writing a streamed body.',
+        ('endpoint', 'method')
+    ),
+    'catalog_response_size_bytes': (
+        'histogram',
+        'Size of the response body.',
+        ('endpoint',)
+    ),
+    'catalog_db_queries_total': (
+        'counter',
+        'SQL statements executed while handling requests.',
+        ('endpoint',)
+    ),
+    'catalog_db_query_seconds_total': (
+        'counter',
+        'Time spent executing SQL statements while handling requests.',
+        ('endpoint',)
+    ),
+    'catalog_cache_requests_total': (
+        'counter',
+        'Reads of a cached value.',
+        ('cache', 'result')
+    ),
+    'catalog_db_pool_connections': (
+        'gauge',
+        'Connections in the database connection pool.',
+        ('state',)
+    )
+}
+
+BUCKETS = {
+    'catalog_request_duration_seconds': (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    ),
+    'catalog_response_size_bytes': (
+        256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216
+    )
+}
+
+
+class Shard(object):
+    '''The metrics recorded by one thread.
+
+    Attributes:
+        counters (dict):    Maps (name, label values) to a count.
+        histograms (dict):  Maps (name, label values) to a list holding the
+            count of each bucket, then the count and the sum of the values.
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        '''Add the metrics of another shard to this one.'''
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        for key, values in other.histograms.items():
+            mine = self.histograms.get(key)
+
+            if mine is None:
+                self.histograms[key] = list(values)
+            else:
+                self.histograms[key] = [a + b for a, b in zip(mine, values)]
+
+
+class _ThreadShards(threading.local):
+
+    def __init__(self):
+        self.shard = Shard()
+
+        with _shardsLock:
+            _shards.append((threading.current_thread(), self.shard))
+
+
+_shards = []
+_shardsLock = threading.Lock()
+_retired = Shard()
+_local = _ThreadShards()
+
+
+def increment(name, labels, amount=1):
+    '''Add to a counter.
+
+    Args:
+        name (string):  The counter's name, from METRICS.
+        labels (tuple): The value of each of the counter's labels.
+        amount (number): The amount to add.
+    '''
+    counters = _local.shard.counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, labels, value):
+    '''Add a value to a histogram.
+
+    Args:
+        name (string):  The histogram's name, from METRICS and BUCKETS.
+        labels (tuple): The value of each of the histogram's labels.
+        value (number): The value observed.
+    '''
+    histograms = _local.shard.histograms
+    key = (name, labels)
+    bounds = BUCKETS[name]
+    counts = histograms.get(key)
+
+    if counts is None:
+        counts = histograms[key] = [0] * (len(bounds) + 3)
+
+    # The last bucket, +Inf, holds the values above every bound.
+    counts[bisect.bisect_left(bounds, value)] += 1
+    counts[-2] += 1
+    counts[-1] += value
+
+
+def collect():
+    '''Merge the metrics recorded by every thread.
+
+    Returns:
+        Shard: The combined metrics.
+    '''
+    combined = Shard()
+
+    with _shardsLock:
+        for entry in list(_shards):
+            thread, shard = entry
+
+            if not thread.is_alive():
+                _retired.merge(shard)
+                _shards.remove(entry)
+            else:
+                combined.merge(shard)
+
+        combined.merge(_retired)
+
+    return combined
+
+
+def poolGauges():
+    '''The state of the database engine's connection pool.
+
+    Returns:
+        dict: Maps a state to a number of connections.  Pools that don't
+            report a state, such as SQLite's in memory pool, are left out.
+    '''
+    from database import engine
+
+    pool = engine.pool
+    gauges = {}
+
+    for state, method in [('size', 'size'), ('checked_out', 'checkedout'),
+                          ('idle', 'checkedin'), ('overflow', 'overflow')]:
+        if hasattr(pool, method):
+            gauges[(state,)] = getattr(pool, method)()
+
+    # A QueuePool counts the connections it has yet to open as negative
+    # overflow.
+    if gauges.get(('overflow',), 0) < 0:
+        gauges[('overflow',)] = 0
+
+    return gauges
+
+
+def formatLabels(names, values):
+    '''Write the labels of a sample in the Prometheus text format.'''
+    return ','.join(
+        '%s="%s"' % (
+            name,
+            unicode(value).replace(
+                '\\', '\\\\'
+            ).replace(
+                '"', '\\"'
+            ).replace(
+                '\n', '\\n'
+            )
+        ) for name, value in zip(names, values)
+    )
+
+
+def formatValue(value):
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value)
+
+
+def exposition():
+    '''Export the metrics in the Prometheus text format.
+
+    Returns:
+        unicode: The exposition, one line for each sample.
+    '''
+    metrics = collect()
+    samples = {}
+
+    for (name, labels), value in metrics.counters.items():
+        samples.setdefault(name, []).append((labels, value))
+
+    for (name, labels), value in metrics.histograms.items():
+        samples.setdefault(name, []).append((labels, value))
+
+    samples['catalog_db_pool_connections'] = poolGauges().items()
+
+    lines = []
+
+    for name in sorted(METRICS):
+        kind, description, labelNames = METRICS[name]
+        lines.append(u'# HELP %s %s' % (name, description))
+        lines.append(u'# TYPE %s %s' % (name, kind))
+
+        for labels, value in sorted(samples.get(name, [])):
+            if kind != 'histogram':
+                lines.append(u'%s{%s} %s' % (
+                    name,
+                    formatLabels(labelNames, labels),
+                    formatValue(value)
+                ))
+                continue
+
+            cumulative = 0
+            bounds = [repr(float(b)) for b in BUCKETS[name]] + ['+Inf']
+
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                lines.append(u'%s_bucket{%s} %d' % (
+                    name,
+                    formatLabels(labelNames + ('le',), labels + (bound,)),
+                    cumulative
+                ))
+
+            lines.append(u'%s_count{%s} %d' % (
+                name, formatLabels(labelNames, labels), value[-2]))
+            lines.append(u'%s_sum{%s} %s' % (
+                name, formatLabels(labelNames, labels), repr(value[-1])))
+
+    return u'\n'.join(lines) + u'\n'
+
+
+class CountingBody(object):
+    '''Count the bytes of a streamed response body as it is written.
+
+    Args:
+        chunks (iterable): The response body.
+
+    Attributes:
+        size (int): The number of bytes written so far.
+    '''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+@app.before_request
+def startRequestMetrics():
+    g.metricsStarted = time.time()
+
+
+@app.after_request
+def measureResponse(response):
+    g.metricsStatus = response.status_code
+
+    if response.is_streamed:
+        g.metricsBody = CountingBody(response.response)
+        response.response = g.metricsBody
+    else:
+        g.metricsSize = response.calculate_content_length()
+
+    return response
+
+
+@app.teardown_request
+def recordRequestMetrics(exc):
+    '''Record the metrics of a finished request.
+
+    Notes:
+        A streamed response is finished once its body has been written.
+    '''
+    started = g.pop('metricsStarted', None)
+
+    if started is None:
+        return
+
+    endpoint = request.endpoint or 'none'
+    status = g.pop('metricsStatus', 500 if exc is not None else None)
+    body = g.pop('metricsBody', None)
+    size = body.size if body is not None else g.pop('metricsSize', None)
+
+    increment(
+        'catalog_requests_total',
+        (endpoint, request.method, str(status))
+    )
+    observe(
+        'catalog_request_duration_seconds',
+        (endpoint, request.method),
+        time.time() - started
+    )
+
+    if size is not None:
+        observe('catalog_response_size_bytes', (endpoint,), size)
+
+    stats = g.get('queryStats')
+
+    if stats is not None:
+        increment('catalog_db_queries_total', (endpoint,), stats.count)
+        increment('catalog_db_query_seconds_total', (endpoint,), stats.time)
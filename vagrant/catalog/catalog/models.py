@@ -14,11 +14,13 @@ a traits property for views that do.
 from sqlalchemy import (
     Column,
     ForeignKey,
+    Index,
     Integer,
     String,
     Date
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, contains_eager
+from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.schema import UniqueConstraint
 from trait import (
     DateTrait,
@@ -29,6 +31,7 @@ from trait import (
     SelectTrait
 )
 from database import Base, session
+from cache import VersionedCache, catalogVersion, categoryVersion, userVersion
 
 
 class Category(Base):
@@ -39,9 +42,15 @@ class Category(Base):
         name (string):          The Category name.
         id (integer):           The primary key/id
         user_id (integer):      The user id of the Category's creator.
+        version (integer):      Counts the changes saved to the Category.
         items (relationship):   Defines the list of items in the Category.
         query (Query):          Shortcut for Querying the Category table
 
+    Notes:
+        The version is checked and advanced by every UPDATE of the
+        Category, so saving changes to a Category that was changed since it
+        was read raises StaleDataError instead of overwriting them.
+
     '''
     __tablename__ = "category"
 
@@ -49,7 +58,10 @@ class Category(Base):
 
     name = Column(String(80), unique=True, nullable=False)
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
+    version = Column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     items = relationship(
         "Item",
@@ -75,10 +87,61 @@ class Category(Base):
     def categories():
         '''List of all Category names in the table.
 
+        Notes:
+            The names are cached until cache.categoryVersion is bumped, by a
+            change to any Category.
+
         Returns:
             A list containg the names of each Category int the table.
         '''
-        return [c.name for c in Category.query.all()]
+        return categoryCache.get()[0]
+
+    @staticmethod
+    def idByName(name):
+        '''Find the id of a Category by its name.
+
+        Notes:
+            The ids are cached along with the names of the Categories until
+            cache.categoryVersion is bumped.  A name missing from the cache,
+            such as that of a Category created after this request read the
+            version, is looked up in the table.
+
+        Args:
+            name (string): The Category name to find.
+
+        Returns:
+            int: The primary key of the Category with the specified name.
+
+        Raises:
+            NoResultFound: No Category has the specified name.
+        '''
+        try:
+            return categoryCache.get()[1][name]
+
+        except KeyError:
+            pass
+
+        key = session.query(Category.id).filter_by(name=name).scalar()
+
+        if key is None:
+            raise NoResultFound("No Category named %s" % name)
+
+        return key
+
+    @staticmethod
+    def loadCategoryNames():
+        '''Load the names and ids of every Category in the table.
+
+        Returns:
+            tuple: A tuple containing the Category names and a dictionary
+                mapping each name to the Category's id.
+        '''
+        rows = session.query(Category.id, Category.name).all()
+
+        return (
+            tuple(c.name for c in rows),
+            dict((c.name, c.id) for c in rows)
+        )
 
     @staticmethod
     def defaultTraits():
@@ -136,18 +199,121 @@ class Category(Base):
         Returns:
             dict: A Dictionary describing key attributes of a Category instance
 
+        '''
+        return Category.serializeValues(
+            self.id,
+            self.name,
+            User.nameByID(self.user_id),
+            [i.serialize for i in self.items],
+            self.version
+        )
+
+    @staticmethod
+    def serializeValues(id, name, creator, items, version):
+        '''Build the serialized form of a Category from its values.
+
+        Args:
+            id (int):           The primary key of the Category.
+            name (string):      The Category name.
+            creator (string):   The name of the User that created the Category.
+            items (list):       The serialized Items in the Category.
+            version (int):      The version of the Category.
+
+        Returns:
+            dict: A Dictionary describing key attributes of a Category.
+
         '''
         cat = {
             'Category': {
-                'id': self.id,
-                'name': self.name,
-                'creator': User.nameByID(self.user_id),
-                'Items': [i.serialize for i in self.items]
+                'id': id,
+                'name': name,
+                'creator': creator,
+                'version': version,
+                'Items': items
             }
         }
 
         return cat
 
+    @staticmethod
+    def serializeAll():
+        '''Serialize every Category in the table along with its Items.
+
+        Notes:
+            Rather than serializing each Category instance, which queries
+            for its creator, its items and each item's creator, the whole
+            catalog is read using one query for the Categories and one for
+            the Items, each joined to the name of their creator.
+            See iterSerialized.
+
+        Returns:
+            list: A serialized Category (see serialize) for each Category in
+                the table, ordered by id.  Each contains its Items, also
+                ordered by id.
+
+        '''
+        return list(Category.iterSerialized())
+
+    @staticmethod
+    def iterSerialized(batchSize=1000):
+        '''Serialize the Categories in the table one at a time, along with
+        their Items.
+
+        Notes:
+            The Categories, ordered by id, and the Items, ordered by their
+            cat_id, are both fetched from the database in batches of
+            batchSize rows.  Walking the two results side by side groups
+            the Items by their Category, so only one batch of each and the
+            current Category's Items are held in memory at any time.
+
+        Args:
+            batchSize (int): The number of rows to fetch from the database
+                at a time.
+
+        Yields:
+            dict: A serialized Category (see serialize) containing its
+                serialized Items.
+
+        '''
+        categories = session.query(
+            Category.id,
+            Category.name,
+            User.name.label('creator'),
+            Category.version
+        ).outerjoin(
+            User, Category.user_id == User.id
+        ).order_by(Category.id).yield_per(batchSize)
+
+        rows = iter(Item.serializedRows().yield_per(batchSize))
+        row = next(rows, None)
+
+        for c in categories:
+            items = []
+
+            # Skip any Items that don't belong to an existing Category.
+            while row is not None and (row.cat_id is None or
+                                       row.cat_id < c.id):
+                row = next(rows, None)
+
+            while row is not None and row.cat_id == c.id:
+                items.append(Item.serializeValues(*row))
+                row = next(rows, None)
+
+            yield Category.serializeValues(
+                c.id,
+                c.name,
+                c.creator,
+                items,
+                c.version
+            )
+
+
+categoryCache = VersionedCache(
+    categoryVersion,
+    Category.loadCategoryNames,
+    'categories'
+)
+
 
 class User(Base):
     '''Users of the Catalog are each assigned a User record that is associated
@@ -170,8 +336,8 @@ class User(Base):
     __tablename__ = "user"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String(250), nullable=False)
-    email = Column(String(100), nullable=False)
+    name = Column(String(250), nullable=False, index=True)
+    email = Column(String(100), nullable=False, index=True)
     picture = Column(String(255), nullable=False)
     items = relationship(
         "Item",
@@ -269,18 +435,35 @@ class Item(Base):
 
         description (string):   The Item's description.
         dateCreated (date):     The Date the Item was created.
+        version (integer):      Counts the changes saved to the Item.
         query (Query):          Shortcut for Querying the Item table.
 
+    Notes:
+        The version is checked and advanced by every UPDATE of the Item, so
+        saving changes to an Item that was changed since it was read raises
+        StaleDataError instead of overwriting them.
+
     '''
     __tablename__ = "item"
     id = Column(Integer, primary_key=True)
-    cat_id = Column(Integer, ForeignKey('category.id'))
-    user_id = Column(Integer, ForeignKey('user.id'))
+    cat_id = Column(Integer, ForeignKey('category.id'), index=True)
+    user_id = Column(Integer, ForeignKey('user.id'), index=True)
     picture = Column(String)
     description = Column(String)
     name = Column(String(250), nullable=False)
     dateCreated = Column(Date)
-    UniqueConstraint('cat_id', 'name', name='name_cat_id')
+    version = Column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    # An Item's name is unique within its Category.  The indexes on the
+    # creation date serve the newest first lists of Items, for the whole
+    # catalog and within a Category.
+    __table_args__ = (
+        UniqueConstraint('cat_id', 'name', name='name_cat_id'),
+        Index('ix_item_dateCreated_id', 'dateCreated', 'id'),
+        Index('ix_item_cat_id_dateCreated_id', 'cat_id', 'dateCreated', 'id')
+    )
 
     query = session.query_property()
 
@@ -296,42 +479,73 @@ class Item(Base):
             created.  The Trait's type changes how it is rendered when
             presented to the user.
         '''
+        categories = Category.categories()
 
         return [
             ImageUploadTrait("picture"),
             TextTrait("name"),
             SelectTrait(
                 "category",
-                Category.categories()[0],
-                Category.categories()
+                categories[0],
+                categories
             ),
             DateTrait("created"),
             TextAreaTrait("description")
         ]
 
 
+    @staticmethod
+    def listing():
+        '''Query for listing Items along with their Category and creator.
+
+        Notes:
+            The Category and User of each Item are joined and loaded in the
+            same query, so describe and creator can be used on the results
+            without querying the database again for every Item.
+
+        Returns:
+            Query: A query of Item records with their category and User
+                relationships already populated.
+        '''
+        return Item.query.outerjoin(
+            Item.category
+        ).outerjoin(
+            Item.User
+        ).options(
+            contains_eager(Item.category),
+            contains_eager(Item.User)
+        )
+
     @property
     def creator(self):
         '''The user name of the Item's creator.
 
+        Notes:
+            Uses the Item's User relationship, which is either already loaded
+            (see listing) or found in the session before querying the table.
+
         Returns:
             string: The name of the user that created the Item record.
 
         '''
-        user = User.query.filter_by(id=self.user_id).one()
-        return user.name
+        return self.User.name
 
     @property
     def describe(self):
         '''Describe an Item by its name and the name of its Category.
 
+        Notes:
+            Uses the Item's category relationship, which is either already
+            loaded (see listing) or found in the session before querying the
+            table.
+
         Returns:
             string: A descriptive string including the Item name and Category.
 
         Example:
             "Stick (Hockey)"
         '''
-        return self.name + " (" + Category.findByID(self.cat_id).name + ")"
+        return self.name + " (" + self.category.name + ")"
 
 
     def traits(self, isEdit=False):
@@ -360,7 +574,7 @@ class Item(Base):
 
         '''
         # Determine the category for this item.
-        category = Category.query.filter_by(id=self.cat_id).one()
+        category = self.category
 
         # Rendering an Edit template.
         if isEdit is True:
@@ -397,17 +611,88 @@ class Item(Base):
         Returns:
             dict: A Dictionary describing key attributes for an Item instance.
 
+        '''
+        return Item.serializeValues(
+            self.id,
+            self.creator,
+            self.name,
+            self.picture,
+            self.description,
+            self.cat_id,
+            self.dateCreated,
+            self.version
+        )
+
+    @staticmethod
+    def serializeValues(id, creator, name, picture, description, cat_id,
+                        dateCreated, version):
+        '''Build the serialized form of an Item from its values.
+
+        Notes:
+            The arguments are in the same order as the columns of the rows
+            returned by serializedRows.
+
+        Args:
+            id (int):               The primary key of the Item.
+            creator (string):       The name of the User that created the Item.
+            name (string):          The Item name.
+            picture (string):       The url to the Item's picture.
+            description (string):   The Item's description.
+            cat_id (int):           The primary key of the Item's Category.
+            dateCreated (date):     The Date the Item was created.
+            version (int):          The version of the Item.
+
+        Returns:
+            dict: A Dictionary describing key attributes for an Item.
+
         '''
         item = {
             'Item': {
-                'id': self.id,
-                'creator': self.creator,
-                'name': self.name,
-                'picture': self.picture,
-                'description': self.description,
-                'cat_id': self.cat_id,
-                'dateCreated': str(self.dateCreated)
+                'id': id,
+                'creator': creator,
+                'name': name,
+                'picture': picture,
+                'description': description,
+                'cat_id': cat_id,
+                'dateCreated': str(dateCreated),
+                'version': version
             }
         }
 
         return item
+
+    @staticmethod
+    def serializedRows():
+        '''Query the values needed to serialize every Item in the table.
+
+        Notes:
+            Each Item is joined to its creator's name, so no further queries
+            are needed to serialize it.
+
+        Returns:
+            Query: Rows of (id, creator, name, picture, description, cat_id,
+                dateCreated, version) ordered by cat_id and then id.
+
+        '''
+        return session.query(
+            Item.id,
+            User.name.label('creator'),
+            Item.name,
+            Item.picture,
+            Item.description,
+            Item.cat_id,
+            Item.dateCreated,
+            Item.version
+        ).outerjoin(
+            User, Item.user_id == User.id
+        ).order_by(Item.cat_id, Item.id)
+
+
+# Everything the Catalog's pages show is read from these models.
+catalogVersion.track(User, Category, Item)
+
+# Items' JSON includes the name of their creator.
+userVersion.track(User)
+
+# The Category names are cached by categoryCache and the sidebar.
+categoryVersion.track(Category)
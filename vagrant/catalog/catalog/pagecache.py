@@ -0,0 +1,183 @@
+'''
+This is the page cache module for the Catalog app.
+The module caches whole pages for visitors who aren't logged in, when
+PAGE_CACHE_ENABLED is set.
+
+GET requests to the routes in PAGE_CACHE_ENDPOINTS are cached by their URL,
+including the query string, along with the catalogVersion they were
+rendered at.  catalogVersion is kept in the database and bumped by every
+change to the Catalog, whichever process makes it, so a page is stale once
+anything has changed since it was rendered.  Checking it costs each request
+a single query.
+
+A stale page is regenerated by the next request for it, while the requests
+that arrive in the meantime are served the stale page rather than
+rendering it again themselves.  Each response says which it was in its
+X-Page-Cache header: hit, stale or miss.
+
+A request bypasses the cache when the session is logged in, so pages that
+show a user's name or their edit and delete buttons are never shared, or
+when the session has flashed messages waiting to be shown.  Pages don't
+hold anything else from the session, as the OAuth state for signing in with
+Google is only fetched when a user signs in.  The pages are sent without a
+cookie and with a Vary: Cookie header, so caches in front of the app can
+share them between visitors who aren't logged in too.
+
+Attributes:
+    pageCache (PageCache): The app's cached pages.
+
+'''
+from collections import OrderedDict
+from threading import Lock
+
+from flask import g, request, Response
+from flask import session as login_session
+
+from app import app
+from auth import isActiveSession
+from cache import catalogVersion
+from metrics import increment
+
+
+class PageCache(object):
+    '''Cache rendered pages by URL until the version they were rendered at
+    changes.
+
+    Notes:
+        The least recently used pages are discarded once there are more than
+        capacity of them.  Each page is kept as its body and mimetype.
+
+    Args:
+        version (SharedVersion): The version of the data the pages show.
+        capacity (int):     The most pages kept.
+    '''
+
+    def __init__(self, version, capacity):
+        self._version = version
+        self.capacity = capacity
+        self._pages = OrderedDict()
+        self._regenerating = set()
+        self._lock = Lock()
+
+    def lookup(self, key):
+        '''Find the page for a URL.
+
+        Notes:
+            When the page is stale and no other request is regenerating it,
+            the caller is made responsible for regenerating it, and must call
+            release once it has finished.
+
+        Args:
+            key (string): The page's URL.
+
+        Returns:
+            tuple: The current version, the page or None, and whether the
+                page is a 'hit', 'stale', or a 'miss' the caller renders.  A
+                'regenerate' is a miss the caller has been made responsible
+                for.
+        '''
+        version = self._version.value
+
+        with self._lock:
+            page = self._pages.pop(key, None)
+
+            if page is not None:
+                # Keep the most recently used pages last.
+                self._pages[key] = page
+
+                if page[0] == version:
+                    return (version, page, 'hit')
+
+            if key in self._regenerating:
+                if page is not None:
+                    return (version, page, 'stale')
+
+                return (version, None, 'miss')
+
+            self._regenerating.add(key)
+            return (version, None, 'regenerate')
+
+    def store(self, key, version, body, mimetype):
+        '''Store a page rendered at a version.
+
+        Args:
+            key (string):       The page's URL.
+            version (int):      The version read before the page was rendered.
+            body (string):      The page's body.
+            mimetype (string):  The page's mimetype.
+        '''
+        with self._lock:
+            self._pages.pop(key, None)
+            self._pages[key] = (version, body, mimetype)
+
+            while len(self._pages) > self.capacity:
+                self._pages.popitem(last=False)
+
+    def release(self, key):
+        '''Allow a page to be regenerated by another request.'''
+        with self._lock:
+            self._regenerating.discard(key)
+
+    def clear(self):
+        '''Discard every page.'''
+        with self._lock:
+            self._pages.clear()
+
+
+pageCache = PageCache(catalogVersion, app.config['PAGE_CACHE_CAPACITY'])
+
+
+def cacheable():
+    '''Can the current request be served from the page cache?'''
+    return app.config['PAGE_CACHE_ENABLED'] and \
+        request.method == 'GET' and \
+        request.endpoint in app.config['PAGE_CACHE_ENDPOINTS'] and \
+        not isActiveSession() and \
+        '_flashes' not in login_session
+
+
+@app.before_request
+def serveCachedPage():
+    if not cacheable():
+        return
+
+    key = request.full_path
+    version, page, status = pageCache.lookup(key)
+
+    if page is None:
+        increment('catalog_cache_requests_total', ('pages', 'miss'))
+        g.pageCache = (key, version, status)
+        return
+
+    increment('catalog_cache_requests_total', ('pages', status))
+
+    response = Response(page[1], mimetype=page[2])
+    response.headers['X-Page-Cache'] = status
+    response.vary.add('Cookie')
+    return response
+
+
+@app.after_request
+def storePage(response):
+    cached = g.get('pageCache')
+
+    if cached is None:
+        return response
+
+    key, version = cached[:2]
+
+    if response.status_code == 200 and not response.is_streamed and \
+            '_flashes' not in login_session:
+        pageCache.store(key, version, response.get_data(), response.mimetype)
+
+    response.headers['X-Page-Cache'] = 'miss'
+    response.vary.add('Cookie')
+    return response
+
+
+@app.teardown_request
+def releasePage(exc):
+    cached = g.get('pageCache')
+
+    if cached is not None and cached[2] == 'regenerate':
+        pageCache.release(cached[0])
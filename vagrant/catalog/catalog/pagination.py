@@ -0,0 +1,266 @@
+'''
+This is the pagination module for the Catalog app.
+The module splits the rows of a query into pages using keyset pagination.
+
+Rather than skipping a number of rows with an OFFSET, each page continues
+from a cursor that holds the values of the ordering columns of the last (or
+first) row on the page before it.  The database can then find the start of
+any page using an index on the ordering columns, so the cost of reading a
+page doesn't depend on how far into the list it is.
+
+Notes:
+    The ordering columns should end with the primary key, so that every row
+    has a distinct position.  Only the first ordering column may be NULL.
+    Rows with NULL in it come before the other rows in ascending order, and
+    after them in descending order, and are read by a query of their own so
+    that both queries can seek in the index.
+
+'''
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_, Date
+
+
+class Page(object):
+    '''One page of the rows of a query.
+
+    Attributes:
+        items (list):           The rows on the page.
+        size (int):             The maximum number of rows on a page.
+        nextCursor (string):    A cursor for the page after this one, or None
+            if this is the last page.
+        prevCursor (string):    A cursor for the page before this one, or None
+            if this is the first page.
+    '''
+
+    def __init__(self, items, size, nextCursor=None, prevCursor=None):
+        self.items = items
+        self.size = size
+        self.nextCursor = nextCursor
+        self.prevCursor = prevCursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encodeCursor(row, columns):
+    '''Encode the position of a row as a cursor.
+
+    Args:
+        row (object):   A row returned by the paginated query.
+        columns (list): The ordering columns of the query.
+
+    Returns:
+        string: A url safe cursor containing the row's values for each of
+            the ordering columns.
+    '''
+    values = []
+
+    for column in columns:
+        value = getattr(row, column.key)
+
+        if isinstance(value, datetime.date):
+            value = value.isoformat()
+
+        values.append(value)
+
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decodeCursor(cursor, columns):
+    '''Decode a cursor created by encodeCursor.
+
+    Args:
+        cursor (string):    The cursor to decode.
+        columns (list):     The ordering columns of the query.
+
+    Returns:
+        list: The values of each of the ordering columns, None for NULL.
+
+    Raises:
+        ValueError: The cursor is not valid for the columns.
+    '''
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+
+    except (TypeError, UnicodeError):
+        raise ValueError("Invalid cursor %r" % cursor)
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("Invalid cursor %r" % cursor)
+
+    for i, column in enumerate(columns):
+        if values[i] is None:
+            if i > 0 or not column.nullable:
+                raise ValueError("Invalid cursor %r" % cursor)
+
+        elif isinstance(column.type, Date):
+            try:
+                values[i] = datetime.datetime.strptime(
+                    values[i],
+                    "%Y-%m-%d"
+                ).date()
+
+            except TypeError:
+                raise ValueError("Invalid cursor %r" % cursor)
+
+    return values
+
+
+def beyondCursor(columns, values, ascending):
+    '''Build the condition for rows that come after a cursor.
+
+    Notes:
+        The condition repeats a bound on the first column on its own, so
+        the database can seek to the cursor's position in an index on the
+        columns instead of reading the index from its start.
+
+    Args:
+        columns (list):     The ordering columns of the query.
+        values (list):      The decoded cursor values for the columns.
+        ascending (Boolean): The direction that the rows are read in.
+
+    Returns:
+        A condition that is true for rows positioned after the cursor when
+        the columns are read in the given direction.
+    '''
+    clauses = []
+
+    for i, column in enumerate(columns):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+
+        if ascending:
+            beyond = column > values[i]
+        else:
+            beyond = column < values[i]
+
+        clauses.append(and_(*(equal + [beyond])))
+
+    if ascending:
+        bound = columns[0] >= values[0]
+    else:
+        bound = columns[0] <= values[0]
+
+    return and_(bound, or_(*clauses))
+
+
+def segments(query, columns, values, ascending):
+    '''Split a paginated query by whether its first ordering column is NULL.
+
+    Notes:
+        NULL sorts first in ascending order in SQLite and last in
+        PostgreSQL, so rather than rely on either, the rows with NULL in the
+        first column are read by a query of their own, ordered by the
+        remaining columns.
+
+    Args:
+        query (Query):      The query to paginate, without an ordering.
+        columns (list):     The ordering columns of the query.
+        values (list):      The decoded cursor values for the columns, or
+            None to read from the start.
+        ascending (Boolean): The direction that the rows are read in.
+
+    Returns:
+        list: A (query, columns) pair for each segment still to be read, in
+            the order they are read, with the first query starting after
+            the cursor.
+    '''
+    first = columns[0]
+
+    if not first.nullable:
+        parts = [(query, columns)]
+
+    else:
+        nulls = (query.filter(first.is_(None)), columns[1:])
+        others = (query.filter(first.isnot(None)), columns)
+        parts = [nulls, others] if ascending else [others, nulls]
+
+        # Skip the segment the cursor has already passed.
+        if values is not None and (values[0] is None) != ascending:
+            parts = parts[1:]
+
+    if values is not None:
+        segmentQuery, segmentColumns = parts[0]
+        segmentValues = values[len(columns) - len(segmentColumns):]
+        parts[0] = (
+            segmentQuery.filter(
+                beyondCursor(segmentColumns, segmentValues, ascending)
+            ),
+            segmentColumns
+        )
+
+    return parts
+
+
+def paginate(query, columns, descending=False, after=None, before=None,
+             size=50):
+    '''Read one page of the rows of a query.
+
+    Notes:
+        With neither cursor given, the first page is read.
+
+    Args:
+        query (Query):          The query to paginate, without an ordering.
+        columns (list):         The columns to order the rows by, ending with
+            the primary key.
+        descending (Boolean):   Order the rows in descending order.
+        after (string):         Read the page following this cursor.
+        before (string):        Read the page preceding this cursor.
+        size (int):             The maximum number of rows on the page.
+
+    Returns:
+        Page: The rows on the page along with the cursors for the pages on
+            either side of it.
+
+    Raises:
+        ValueError: One of the cursors is not valid.
+    '''
+    forward = before is None
+    cursor = after if forward else before
+
+    # Pages before the cursor are read in the opposite direction and then
+    # put back in order.
+    ascending = descending != forward
+
+    values = None
+
+    if cursor is not None:
+        values = decodeCursor(cursor, columns)
+
+    rows = []
+
+    for segmentQuery, segmentColumns in segments(query, columns, values,
+                                                 ascending):
+        ordering = [c.asc() if ascending else c.desc() for c in segmentColumns]
+        rows.extend(
+            segmentQuery.order_by(*ordering).limit(size + 1 - len(rows)).all()
+        )
+
+        if len(rows) > size:
+            break
+
+    more = len(rows) > size
+    rows = rows[:size]
+
+    if not forward:
+        rows.reverse()
+
+    page = Page(rows, size)
+
+    if rows:
+        first = encodeCursor(rows[0], columns)
+        last = encodeCursor(rows[-1], columns)
+
+        if forward:
+            page.nextCursor = last if more else None
+            page.prevCursor = first if after is not None else None
+        else:
+            page.nextCursor = last
+            page.prevCursor = first if more else None
+
+    return page
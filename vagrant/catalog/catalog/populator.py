@@ -12,9 +12,13 @@ Attributes:
     category_names (strings):       Names of each Category.
     user_male_names (strings):      Male User Names.
     user_female_names (strings):    Female User Names.
+    GENERATED_DATE (date):          The date the creation dates of a
+                                    generated catalog count back from.
 
     parser (Parser):                The command-line parser that populates the
-                                    database when give the -r option.
+                                    database when give the -r option, or
+                                    generates a synthetic catalog of any size
+                                    when given the -g option.
 
     args (list):                    The list of arguments passed to the parser.
 
@@ -23,12 +27,14 @@ if __name__ == '__main__' and '__package__' is None:
     from os import sys, path
     sys.path.append(path.dirname(path.abspath(__file__)))
 
-from random import randint
 import datetime
 import random
 import argparse
 
-from database import init_db, session
+from sqlalchemy import func
+
+from cache import bumpTracking
+from database import init_db, migrate_db, session
 from models import Category, Item, User
 
 item_names = [
@@ -130,17 +136,39 @@ user_female_names = [
 ]
 
 
-def randomCreationDate():
+# Generated catalogs count back from a fixed date rather than today's, so a
+# seed generates the same dates whenever it is run.
+GENERATED_DATE = datetime.date(2016, 6, 1)
+
+
+def parseDate(value):
+    '''Parse a date given on the command line as YYYY-MM-DD.'''
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("%r is not a YYYY-MM-DD date" % value)
+
+
+def randomCreationDate(today=None, rand=random):
     '''Randomly choose a date for an Item or Category's creation from within
     the last 18 months at the time the module is executed.
 
+    Args:
+        today (date):       The date to count back from, defaults to today's
+            date.
+        rand (Random):      The source of random numbers, defaults to the
+            random module.
+
     Returns:
         datetime: A random date from the previous 540 days at the time
             the function was executed.
     '''
 
-    today = datetime.date.today()
-    days_old = randint(0, 540)
+    if today is None:
+        today = datetime.date.today()
+
+    days_old = rand.randint(0, 540)
     created = today - datetime.timedelta(days=days_old)
     return created
 
@@ -367,6 +395,122 @@ class ItemPopulator(object):
         session.commit()
 
 
+class CatalogGenerator(object):
+    '''Generates a synthetic Catalog of any size for finding scaling
+    problems.
+
+    Notes:
+        The names, descriptions and images of the Users, Categories and
+        Items are drawn from the lists in this module, with a number added
+        to keep them distinct.  The records are inserted in bulk, batchSize
+        rows in each transaction, and are given ids following the largest
+        ids already in the database.  The rows aren't inserted through the
+        models, so each batch bumps the versions that track them itself.
+
+    Attributes:
+        seed (int):         Seeds the random choices, so the same seed
+            generates the same Catalog.
+        batchSize (int):    The number of rows inserted in each transaction.
+        date (date):        The creation dates are chosen from the 540 days
+            before this date.
+    '''
+
+    def __init__(self, seed=0, batchSize=50000, date=GENERATED_DATE):
+        '''Initialize the Database connection.'''
+        init_db()
+        migrate_db()
+        self.seed = seed
+        self.batchSize = batchSize
+        self.date = date
+
+    def nextID(self, model):
+        '''The id following the largest id in a model's table.'''
+        return (session.query(func.max(model.id)).scalar() or 0) + 1
+
+    def insert(self, model, rows):
+        '''Insert rows into a model's table in batches.
+
+        Args:
+            model (class):      The model of the table.
+            rows (iterable):    A dictionary of column values for each row.
+        '''
+        table = model.__table__
+        batch = []
+
+        for row in rows:
+            batch.append(row)
+
+            if len(batch) == self.batchSize:
+                session.execute(table.insert(), batch)
+                bumpTracking([model])
+                session.commit()
+                batch = []
+
+        if batch:
+            session.execute(table.insert(), batch)
+            bumpTracking([model])
+            session.commit()
+
+    def generate(self, users, categories, items):
+        '''Generate and insert Users, Categories and Items.
+
+        Args:
+            users (int):        The number of Users to generate.
+            categories (int):   The number of Categories to generate.
+            items (int):        The number of Items to generate.
+        '''
+        rand = random.Random(self.seed)
+        names = user_male_names + user_female_names
+
+        firstUser = self.nextID(User)
+        firstCategory = self.nextID(Category)
+        firstItem = self.nextID(Item)
+
+        userIDs = range(firstUser, firstUser + users)
+        categoryIDs = range(firstCategory, firstCategory + categories)
+
+        def userRows():
+            for n, id in enumerate(userIDs):
+                name = "%s %d" % (names[n % len(names)], id)
+                yield {
+                    'id': id,
+                    'name': name,
+                    'email': generateEmail(name).replace(
+                        "@", "%d@" % id),
+                    'picture': "images/male_avatar.png"
+                    if n % len(names) < len(user_male_names)
+                    else "images/female_avatar.png"
+                }
+
+        def categoryRows():
+            for n, id in enumerate(categoryIDs):
+                yield {
+                    'id': id,
+                    'name': "%s %d" % (
+                        category_names[n % len(category_names)], id),
+                    'user_id': rand.choice(userIDs)
+                }
+
+        def itemRows():
+            for id in xrange(firstItem, firstItem + items):
+                n = rand.randrange(len(item_names))
+                yield {
+                    'id': id,
+                    'cat_id': rand.choice(categoryIDs),
+                    'user_id': rand.choice(userIDs),
+                    'picture': item_images[n],
+                    'name': "%s %d" % (item_names[n], id),
+                    'description': item_descriptions[n],
+                    'dateCreated': randomCreationDate(self.date, rand)
+                }
+
+        self.insert(User, userRows())
+        self.insert(Category, categoryRows())
+
+        if userIDs and categoryIDs:
+            self.insert(Item, itemRows())
+
+
 # Only run the Database Population Functions when specified on the
 # command line by using the run argument
 parser = argparse.ArgumentParser(
@@ -381,7 +525,41 @@ parser.add_argument(
     help='Run the population funcitons.'
 )
 
-args = parser.parse_args()
+parser.add_argument(
+    '-g',
+    '--generate',
+    action='store_true',
+    dest='generate',
+    default=False,
+    help='Generate a synthetic catalog of the sizes given below.'
+)
+
+parser.add_argument(
+    '--users', type=int, default=1000, help='Number of users to generate.')
+
+parser.add_argument(
+    '--categories', type=int, default=100,
+    help='Number of categories to generate.')
+
+parser.add_argument(
+    '--items', type=int, default=100000, help='Number of items to generate.')
+
+parser.add_argument(
+    '--seed', type=int, default=0, help='Seed for the generated catalog.')
+
+parser.add_argument(
+    '--date', type=parseDate, default=GENERATED_DATE,
+    help='Date the generated creation dates count back from, as YYYY-MM-DD.')
+
+parser.add_argument(
+    '--batch', type=int, default=50000,
+    help='Number of rows inserted in each transaction.')
+
+# Modules that import this one don't pass their command line arguments on.
+if __name__ == '__main__':
+    args = parser.parse_args()
+else:
+    args = parser.parse_args([])
 
 '''
 The run argument was specified, so we populate the database.
@@ -393,3 +571,7 @@ if args.populate is True:
     init_db()
     p = ItemPopulator()
     p.populate()
+
+if args.generate is True:
+    g = CatalogGenerator(args.seed, args.batch, args.date)
+    g.generate(args.users, args.categories, args.items)
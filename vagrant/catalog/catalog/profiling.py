@@ -0,0 +1,177 @@
+'''
+This is the profiling module for the Catalog app.
+The module profiles single requests with cProfile, on demand.
+
+A request is profiled when it carries a profile token, in the header named
+by PROFILE_HEADER or the query parameter named by PROFILE_PARAMETER, and is
+made by the administrator the token was issued to.  Tokens are signed with
+the app's secret key, name the administrator's user id and expire after
+PROFILE_TOKEN_MAX_AGE seconds.  An administrator is issued a token by the
+/debug/profile/token route.
+
+The profiler runs from before the view is called until the response is
+finished, so it includes rendering the view's template and, for a streamed
+response, writing its body.  Each token asks for one of two outputs:
+
+    pstats:     The profile is saved to a .pstats file in PROFILE_DIR, whose
+        name is returned in the X-Profile header.
+    summary:    The response is replaced by the PROFILE_TOP functions with
+        the greatest cumulative time, as plain text.
+
+A streamed response has been sent by the time its profile is complete, so
+its profile is always saved to a file, and its summary is logged.
+
+Requests without a token only pay for looking the header and parameter up.
+
+Attributes:
+    MODES (tuple): The outputs a token can ask for.
+
+'''
+import cProfile
+import os
+import pstats
+import time
+from StringIO import StringIO
+
+from flask import g, request, Response
+from flask import session as login_session
+from itsdangerous import URLSafeTimedSerializer, BadData
+
+from app import app
+from auth import isAdminSession
+
+MODES = ('pstats', 'summary')
+
+
+def tokenSerializer():
+    return URLSafeTimedSerializer(app.secret_key, salt='catalog-profile')
+
+
+def issueToken(mode):
+    '''Sign a profile token for the administrator currently logged in.
+
+    Args:
+        mode (string): One of MODES.
+
+    Returns:
+        string: The token.
+    '''
+    return tokenSerializer().dumps({
+        'user_id': login_session['user_id'],
+        'mode': mode
+    })
+
+
+def requestedMode():
+    '''Check the current request for a valid profile token.
+
+    Returns:
+        string: The output the token asks for, or None if the request
+            shouldn't be profiled.
+    '''
+    token = request.headers.get(app.config['PROFILE_HEADER']) or \
+        request.args.get(app.config['PROFILE_PARAMETER'])
+
+    if not token:
+        return None
+
+    try:
+        claims = tokenSerializer().loads(
+            token,
+            max_age=app.config['PROFILE_TOKEN_MAX_AGE']
+        )
+
+    except BadData:
+        return None
+
+    if not isinstance(claims, dict) or claims.get('mode') not in MODES:
+        return None
+
+    if not isAdminSession() or \
+            claims.get('user_id') != login_session.get('user_id'):
+        return None
+
+    return claims['mode']
+
+
+def summarize(profiler):
+    '''The functions with the greatest cumulative time in a profile.
+
+    Args:
+        profiler (Profile): A finished profile.
+
+    Returns:
+        string: The report of the top PROFILE_TOP functions.
+    '''
+    report = StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats('cumulative').print_stats(app.config['PROFILE_TOP'])
+    return report.getvalue()
+
+
+def saveProfile(profiler, endpoint):
+    '''Save a profile to PROFILE_DIR.
+
+    Args:
+        profiler (Profile): A finished profile.
+        endpoint (string):  The route that was profiled.
+
+    Returns:
+        string: The name of the .pstats file.
+    '''
+    directory = app.config['PROFILE_DIR']
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    name = "%s-%d.pstats" % (endpoint or 'none', int(time.time() * 1000000))
+    profiler.dump_stats(os.path.join(directory, name))
+
+    return name
+
+
+@app.before_request
+def startProfile():
+    mode = requestedMode()
+
+    if mode is None:
+        return
+
+    g.profileMode = mode
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+
+@app.after_request
+def finishProfile(response):
+    '''Finish the profile of a response that isn't streamed, leaving a
+    streamed response to be finished when the request is torn down.'''
+    profiler = g.get('profiler')
+
+    if profiler is None or response.is_streamed:
+        return response
+
+    profiler.disable()
+    g.profiler = None
+
+    if g.profileMode == 'summary':
+        return Response(summarize(profiler), mimetype="text/plain")
+
+    response.headers['X-Profile'] = saveProfile(profiler, request.endpoint)
+    return response
+
+
+@app.teardown_request
+def finishStreamedProfile(exc):
+    profiler = g.get('profiler')
+
+    if profiler is None:
+        return
+
+    profiler.disable()
+    g.profiler = None
+
+    name = saveProfile(profiler, request.endpoint)
+
+    if g.profileMode == 'summary':
+        app.logger.info("Profile %s:\n%s", name, summarize(profiler))
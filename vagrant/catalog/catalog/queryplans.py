@@ -0,0 +1,193 @@
+'''
+A module for checking that the Catalog app's most frequent queries are
+answered using indexes.
+
+Each hot query is built the same way the views and models build it and its
+query plan is retrieved from the database.  A plan that scans a whole table
+or sorts every row to satisfy an ORDER BY is reported.
+
+Run the module from the project's root directory to check the plans against
+the app's database:
+
+    python catalog/queryplans.py
+
+Attributes:
+    HOT_QUERIES (list): (name, function) pairs.  Each function returns the
+        Query whose plan is checked.
+
+'''
+if __name__ == '__main__' and __package__ is None:
+    from os import sys, path
+    sys.path.append(path.dirname(path.abspath(__file__)))
+
+import datetime
+import sys
+
+from database import init_db, migrate_db, explain, engine, session
+from models import Category, Item, User
+from pagination import beyondCursor, segments
+
+
+def itemsByName():
+    '''The duplicate name check in newItem and editItem.'''
+    return Item.query.filter_by(cat_id=1, name="Snowboard")
+
+
+def itemsPage():
+    '''A page of listItem after the first.'''
+    columns = [Item.dateCreated, Item.id]
+    query, columns = segments(
+        Item.listing(),
+        columns,
+        [datetime.date.today(), 1],
+        False
+    )[0]
+    return query.order_by(Item.dateCreated.desc(), Item.id.desc()).limit(51)
+
+
+def undatedItemsPage():
+    '''A page of listItem among the Items without a creation date.'''
+    columns = [Item.dateCreated, Item.id]
+    query, columns = segments(Item.listing(), columns, [None, 1], False)[0]
+    return query.order_by(Item.id.desc()).limit(51)
+
+
+def categoryItemsPage():
+    '''A page of listCategoryItem after the first.'''
+    columns = [Item.dateCreated, Item.id]
+    query, columns = segments(
+        Item.listing().filter(Item.cat_id == 1),
+        columns,
+        [datetime.date.today(), 1],
+        False
+    )[0]
+    return query.order_by(Item.dateCreated.desc(), Item.id.desc()).limit(51)
+
+
+def categoriesPage():
+    '''A page of listCategory after the first.'''
+    columns = [Category.name, Category.id]
+    return Category.query.filter(
+        beyondCursor(columns, ["Hockey", 1], True)
+    ).order_by(Category.name, Category.id).limit(51)
+
+
+def usersPage():
+    '''A page of listUser after the first.'''
+    columns = [User.name, User.id]
+    return User.query.filter(
+        beyondCursor(columns, ["Amy Adams", 1], True)
+    ).order_by(User.name, User.id).limit(51)
+
+
+def userByEmail():
+    '''The User lookup in auth.getUserID.'''
+    return User.query.filter_by(email="amy@gmail.com")
+
+
+def categoryByName():
+    '''The Category lookup in viewCatItem and the Item forms.'''
+    return Category.query.filter_by(name="Hockey")
+
+
+def itemByCategoryAndName():
+    '''The Item lookup in viewCatItem.'''
+    return Item.query.filter_by(name="Stick", cat_id=3)
+
+
+def serializedItems():
+    '''The Items read by Category.iterSerialized.'''
+    return Item.serializedRows()
+
+
+HOT_QUERIES = [
+    ('itemsByName', itemsByName),
+    ('itemsPage', itemsPage),
+    ('undatedItemsPage', undatedItemsPage),
+    ('categoryItemsPage', categoryItemsPage),
+    ('categoriesPage', categoriesPage),
+    ('usersPage', usersPage),
+    ('userByEmail', userByEmail),
+    ('categoryByName', categoryByName),
+    ('itemByCategoryAndName', itemByCategoryAndName),
+    ('serializedItems', serializedItems)
+]
+
+
+def queryPlan(query):
+    '''Retrieve the database's query plan for a Query.
+
+    Args:
+        query (Query): The query to explain.
+
+    Returns:
+        list: The lines of the query plan.
+    '''
+    compiled = query.statement.compile(dialect=engine.dialect)
+
+    if compiled.positional:
+        parameters = tuple(compiled.params[k] for k in compiled.positiontup)
+    else:
+        parameters = compiled.params
+
+    return explain(unicode(compiled), parameters)
+
+
+def usesIndexes(plan):
+    '''Does a query plan avoid scanning or sorting a whole table?
+
+    Args:
+        plan (list): The lines of a query plan.
+
+    Returns:
+        True if every table is read through an index and no ORDER BY is
+        satisfied by sorting the rows, otherwise False.
+    '''
+    for line in plan:
+        # SQLite
+        if line.startswith("SCAN") and " USING " not in line:
+            return False
+
+        if line == "USE TEMP B-TREE FOR ORDER BY":
+            return False
+
+        # PostgreSQL
+        if "Seq Scan" in line:
+            return False
+
+    return True
+
+
+def checkQueryPlans():
+    '''Check the query plan of each of the HOT_QUERIES.
+
+    Returns:
+        list: (name, plan) for each hot query whose plan doesn't use indexes.
+    '''
+    failures = []
+
+    for name, build in HOT_QUERIES:
+        plan = queryPlan(build())
+
+        if not usesIndexes(plan):
+            failures.append((name, plan))
+
+    session.remove()
+    return failures
+
+
+if __name__ == '__main__':
+    init_db()
+    migrate_db()
+
+    failures = checkQueryPlans()
+
+    for name, plan in failures:
+        print "%s does not use an index:" % name
+        for line in plan:
+            print "    " + line
+
+    if not failures:
+        print "All %d hot queries use indexes." % len(HOT_QUERIES)
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,185 @@
+'''
+This is the sampler module for the Catalog app.
+The module is a statistical profiler that is cheap enough to leave running.
+
+A background thread wakes every SAMPLER_INTERVAL seconds and takes the
+stack of each thread that is handling a request.  The stacks are counted by
+the route the thread is handling, so over time the counts show where each
+route spends its time: in the views, the models, rendering Traits or the
+Jinja templates.
+
+The counts are exported in the collapsed stack format used by flame graph
+tools, one line for each distinct stack:
+
+    listItem;catalog.views:listItem;jinja2.environment:render;... 12
+
+The sampler only reads the stacks of threads while they handle a request,
+and doesn't slow those threads down beyond the moment it takes to read
+them.
+
+Attributes:
+    sampler (Sampler): The app's sampler, started by the first request when
+        SAMPLER_ENABLED is set.
+
+'''
+import atexit
+import os
+import sys
+import threading
+
+from flask import request
+
+from app import app
+
+
+def frameLabel(frame):
+    '''Name the function a stack frame is running.
+
+    Returns:
+        string: The function's module and name, or the file's name for
+            code that isn't in a module, such as a compiled template.
+    '''
+    code = frame.f_code
+
+    if code.co_filename.endswith('.py') or code.co_filename.endswith('.pyc'):
+        module = frame.f_globals.get('__name__', '?')
+    else:
+        module = os.path.basename(code.co_filename)
+
+    return "%s:%s" % (module, code.co_name)
+
+
+class Sampler(object):
+    '''Sample the stacks of the threads that are handling requests.
+
+    Args:
+        interval (float):   Seconds between samples.
+        maxStacks (int):    The most distinct stacks counted.  Samples of
+            further stacks are dropped.
+
+    Attributes:
+        samples (int):  The number of stacks sampled.
+        dropped (int):  The number of samples dropped.
+    '''
+
+    def __init__(self, interval, maxStacks):
+        self.interval = interval
+        self.maxStacks = maxStacks
+        self.samples = 0
+        self.dropped = 0
+        self._counts = {}
+        self._active = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def begin(self, endpoint):
+        '''Mark the current thread as handling a request to a route.'''
+        self._active[threading.current_thread().ident] = endpoint
+
+    def end(self):
+        '''Mark the current thread as no longer handling a request.'''
+        self._active.pop(threading.current_thread().ident, None)
+
+    def start(self):
+        '''Start the sampling thread, if it isn't already running.'''
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="Sampler"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+                # Stop sampling before the interpreter tears the modules
+                # the thread uses down.
+                atexit.register(self.stop)
+
+    def stop(self):
+        '''Stop the sampling thread and wait for it to finish.'''
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def sample(self):
+        '''Count the current stack of each thread handling a request.'''
+        frames = sys._current_frames()
+
+        for ident, endpoint in self._active.items():
+            frame = frames.get(ident)
+
+            if frame is None:
+                continue
+
+            stack = []
+
+            while frame is not None:
+                stack.append(frameLabel(frame))
+                frame = frame.f_back
+
+            stack.append(endpoint)
+            key = tuple(reversed(stack))
+            self.samples += 1
+
+            if key in self._counts:
+                self._counts[key] += 1
+            elif len(self._counts) < self.maxStacks:
+                self._counts[key] = 1
+            else:
+                self.dropped += 1
+
+    def collapsed(self, endpoint=None):
+        '''Export the counted stacks in the collapsed stack format.
+
+        Args:
+            endpoint (string): Only export the stacks of this route.
+
+        Returns:
+            string: One line for each stack, its frames from the route down
+                separated by semicolons, followed by its count.
+        '''
+        lines = [
+            "%s %d" % (';'.join(stack), count)
+            for stack, count in sorted(self._counts.items())
+            if endpoint is None or stack[0] == endpoint
+        ]
+
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def reset(self):
+        '''Discard the counted stacks.'''
+        self._counts = {}
+        self.samples = 0
+        self.dropped = 0
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sample()
+
+            except Exception:
+                app.logger.exception("Sampling the request stacks failed")
+
+
+sampler = Sampler(
+    app.config['SAMPLER_INTERVAL'],
+    app.config['SAMPLER_MAX_STACKS']
+)
+
+
+@app.before_first_request
+def startSampler():
+    if app.config['SAMPLER_ENABLED']:
+        sampler.start()
+
+
+@app.before_request
+def beginSample():
+    sampler.begin(request.endpoint or 'none')
+
+
+@app.teardown_request
+def endSample(exc):
+    sampler.end()
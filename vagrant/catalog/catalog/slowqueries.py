@@ -0,0 +1,180 @@
+'''
+This is the slow query module for the Catalog app.
+The module logs the SQL statements that take longer than the
+SLOW_QUERY_THRESHOLD setting to execute.
+
+Each entry in the log is a line of JSON with the statement, its bound
+parameters, the route that was handling the request, the app code that
+executed the statement and the time it took.  Until the plan of a statement
+of a given shape has been written to the log, it is retrieved from the
+database and added to the entry of each statement of that shape.  Statements
+with the same shape differ only in their bound parameters, or in the number
+of values in an IN list.
+
+Entries are queued and written by a background thread, so a request isn't
+held up by writing the log or by explaining its statement.  When the queue
+is full, entries are dropped and counted rather than blocking the request.
+
+Attributes:
+    INSTRUMENTATION (tuple): The modules that execute no statements of their
+        own, so they are passed over when finding the code that executed one.
+    slowQueryLog (SlowQueryLog): The log of the app's slow statements.
+
+'''
+import datetime
+import json
+import os
+import re
+import time
+import traceback
+
+from flask import has_request_context, request
+
+from app import app
+from database import explain
+from logwriter import BufferedLogWriter
+
+INSTRUMENTATION = ('instrumentation', 'slowqueries')
+
+
+def statementShape(statement):
+    '''Reduce an SQL statement to its shape.
+
+    Args:
+        statement (string): The SQL statement.
+
+    Returns:
+        string: The statement with its whitespace collapsed and any list of
+            parameter placeholders reduced to a single placeholder.
+    '''
+    shape = re.sub(r'\s+', ' ', statement.strip())
+    shape = re.sub(r'\?(, \?)+', '?', shape)
+    return re.sub(r'%\(\w+?\)s(, %\(\w+?\)s)+', '%(list)s', shape)
+
+
+def callingCode():
+    '''Find the app code that executed the current statement.
+
+    Returns:
+        string: The module, line and function of the innermost frame in the
+            app's code, outside of the instrumentation, or None.
+    '''
+    root = app.config['APP_ROOT']
+
+    for filename, line, function, text in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(filename)
+        module = os.path.splitext(os.path.basename(filename))[0]
+
+        if filename.startswith(root) and module not in INSTRUMENTATION:
+            return "%s:%d in %s" % (os.path.basename(filename), line, function)
+
+    return None
+
+
+def jsonValue(value):
+    '''Convert a bound parameter that JSON doesn't support to a string.'''
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+
+    return repr(value)
+
+
+class SlowQueryLog(object):
+    '''Log the statements that take longer than a threshold to execute.
+
+    Args:
+        threshold (float):  Seconds a statement must take to be logged, or
+            None to log nothing.
+        path (string):      The file the log is appended to, or None to log
+            to the app's logger.
+        capacity (int):     The most entries waiting to be written.
+
+    Attributes:
+        writer (BufferedLogWriter): Writes the log's entries.
+    '''
+
+    def __init__(self, threshold, path, capacity):
+        self.threshold = threshold
+        self.writer = BufferedLogWriter(
+            path,
+            capacity,
+            self.prepare,
+            "Slow query",
+            self.written
+        )
+
+        # The shapes whose plan has been written to the log.  Only the
+        # writer's thread uses it.
+        self._explained = set()
+
+    def record(self, statement, parameters, elapsed, executemany=False):
+        '''Log an executed statement if it was slow.
+
+        Args:
+            statement (string):     The SQL statement.
+            parameters (tuple or dict): Its bound parameters, or a list of
+                them for executemany.
+            elapsed (float):        Seconds spent executing it.
+            executemany (Boolean):  The statement was executed for each set
+                of parameters.
+
+        Returns:
+            True if the statement was logged.
+        '''
+        if self.threshold is None or elapsed < self.threshold:
+            return False
+
+        # Explaining the plan of a slow EXPLAIN would log it again.
+        if statement.lstrip().upper().startswith("EXPLAIN"):
+            return False
+
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+
+        return self.writer.write({
+            'time': time.time(),
+            'duration': elapsed,
+            'statement': statement,
+            'parameters': parameters,
+            'executemany': executemany,
+            'endpoint': request.endpoint if has_request_context() else None,
+            'caller': callingCode(),
+            'shape': statementShape(statement)
+        })
+
+    def prepare(self, entry):
+        '''Write an entry as a line of JSON, explaining its statement unless
+        the plan of a statement of its shape has already been written.'''
+        line = dict(entry)
+        del line['shape']
+
+        if entry['shape'] not in self._explained:
+            try:
+                line['plan'] = explain(
+                    entry['statement'],
+                    entry['parameters']
+                )
+
+            except Exception as e:
+                line['plan'] = None
+                line['planError'] = str(e)
+
+        return json.dumps(line, default=jsonValue)
+
+    def written(self, entries):
+        '''Remember the shapes of the entries that have been written, so
+        their plans aren't written again.
+
+        Notes:
+            An entry that is dropped, or whose line couldn't be written,
+            isn't passed here, so the plan of its shape is written with the
+            next statement of that shape.
+        '''
+        self._explained.update(entry['shape'] for entry in entries)
+
+
+slowQueryLog = SlowQueryLog(
+    app.config['SLOW_QUERY_THRESHOLD'],
+    app.config['SLOW_QUERY_LOG'],
+    app.config['SLOW_QUERY_LOG_CAPACITY']
+)
@@ -0,0 +1,259 @@
+'''
+This is the tracing module for the Catalog app.
+The module records spans for the phases of each request, when TRACING is
+set, and writes them to the TRACE_FILE as lines of JSON.
+
+Spans are recorded for:
+
+    request:    The whole request, including writing a streamed body.
+    view:       The route's view function.
+    db:         Each SQL statement.
+    trait:      Each Trait rendered, by renderInputs, renderOutputs,
+        asInputElement or asOutputElement.
+    urls:       Each construction of a Urls.
+    template:   The rendering of each template, including generic.html and
+        the partials it includes.
+
+Each line is an event in the Trace Event format read by chrome://tracing
+and Perfetto, a complete ("X") event with its start and duration in
+microseconds.  Spans of the same thread nest by time, so a slow request
+shows whether its time went to the database, the Traits or the templates.
+To open a trace, gather the lines into a JSON array:
+
+    jq -s . catalog/traces.jsonl > trace.json
+
+The app is only instrumented when TRACING is set as the module is imported,
+so tracing costs nothing when it is off.
+
+Attributes:
+    traceLog (BufferedLogWriter): Writes the traces of finished requests.
+
+'''
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+
+import trait
+from app import app
+from database import engine
+from logwriter import BufferedLogWriter
+from urls import Urls
+
+
+def microseconds(seconds):
+    return int(seconds * 1000000)
+
+
+class Trace(object):
+    '''The spans recorded for a single request.
+
+    Attributes:
+        events (list): The spans, as Trace Event format events.
+    '''
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+        self.tid = threading.current_thread().ident
+
+    def add(self, name, category, start, end, args=None):
+        '''Add a span.
+
+        Args:
+            name (string):      The span's name.
+            category (string):  The phase of the request the span belongs to.
+            start (float):      The time the span started.
+            end (float):        The time the span ended.
+            args (dict):        Details to show with the span.
+        '''
+        span = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': microseconds(start),
+            'dur': microseconds(end - start),
+            'pid': self.pid,
+            'tid': self.tid
+        }
+
+        if args:
+            span['args'] = args
+
+        self.events.append(span)
+
+
+def currentTrace():
+    '''The Trace of the request being handled, or None.'''
+    if not has_request_context():
+        return None
+
+    return g.get('trace')
+
+
+def traced(name, category, function):
+    '''Wrap a function so that each call is recorded as a span.
+
+    Args:
+        name (string):      The span's name.
+        category (string):  The phase of the request the span belongs to.
+        function (function): The function to wrap.
+
+    Returns:
+        function: The wrapped function.
+    '''
+    @wraps(function)
+    def tracedFunction(*args, **kwargs):
+        trace = currentTrace()
+
+        if trace is None:
+            return function(*args, **kwargs)
+
+        start = time.time()
+
+        try:
+            return function(*args, **kwargs)
+
+        finally:
+            trace.add(name, category, start, time.time())
+
+    return tracedFunction
+
+
+def tracedRender(name, render):
+    '''Wrap a template's render function so that rendering it is recorded as
+    a span.
+
+    Notes:
+        A template renders by yielding its output, including the output of
+        the templates it includes, so the span lasts until the last piece
+        has been yielded.
+    '''
+    def tracedRenderFunction(context):
+        trace = currentTrace()
+
+        if trace is None:
+            for piece in render(context):
+                yield piece
+            return
+
+        start = time.time()
+
+        try:
+            for piece in render(context):
+                yield piece
+
+        finally:
+            trace.add(name, 'template', start, time.time())
+
+    return tracedRenderFunction
+
+
+class TracedTemplate(Template):
+    '''A Jinja template that records a span each time it is rendered.'''
+
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super(TracedTemplate, cls)._from_namespace(
+            environment,
+            namespace,
+            globals
+        )
+        template.root_render_func = tracedRender(
+            template.name,
+            template.root_render_func
+        )
+        return template
+
+
+def startQuerySpan(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('traceStart', []).append(time.time())
+
+
+def finishQuerySpan(conn, cursor, statement, parameters, context,
+                    executemany):
+    start = conn.info['traceStart'].pop()
+    trace = currentTrace()
+
+    if trace is not None:
+        trace.add(
+            statement.split(None, 1)[0],
+            'db',
+            start,
+            time.time(),
+            {'statement': statement}
+        )
+
+
+def startTrace():
+    g.trace = Trace()
+    g.traceStart = time.time()
+
+
+def finishTrace(exc):
+    trace = g.get('trace')
+
+    if trace is None:
+        return
+
+    trace.add(
+        request.endpoint or request.path,
+        'request',
+        g.traceStart,
+        time.time(),
+        {'method': request.method, 'path': request.path}
+    )
+    g.trace = None
+    traceLog.write(trace.events)
+
+
+def traceViews():
+    '''Wrap each of the app's view functions so that it is recorded as a
+    span.'''
+    for endpoint, view in app.view_functions.items():
+        app.view_functions[endpoint] = traced(endpoint, 'view', view)
+
+
+def instrument():
+    '''Instrument the app, the database engine, the Traits, Urls and the
+    Jinja templates to record spans.'''
+    app.before_request(startTrace)
+    app.teardown_request(finishTrace)
+    app.before_first_request(traceViews)
+
+    event.listen(engine, 'before_cursor_execute', startQuerySpan)
+    event.listen(engine, 'after_cursor_execute', finishQuerySpan)
+
+    for name in dir(trait):
+        cls = getattr(trait, name)
+
+        if not isinstance(cls, type) or not issubclass(cls, trait.Trait):
+            continue
+
+        for method in ('inputParts', 'outputParts'):
+            if method in cls.__dict__:
+                setattr(cls, method, traced(
+                    "%s.%s" % (cls.__name__, method),
+                    'trait',
+                    cls.__dict__[method]
+                ))
+
+    Urls.__init__ = traced('Urls', 'urls', Urls.__dict__['__init__'])
+
+    app.jinja_env.template_class = TracedTemplate
+
+
+traceLog = BufferedLogWriter(
+    app.config['TRACE_FILE'],
+    app.config['TRACE_CAPACITY'],
+    lambda events: '\n'.join(json.dumps(e) for e in events),
+    "Trace"
+)
+
+if app.config['TRACING']:
+    instrument()
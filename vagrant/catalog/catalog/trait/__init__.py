@@ -5,5 +5,8 @@ from trait import (
     ImageTrait,
     ImageUploadTrait,
     SelectTrait,
-    DateTrait
+    DateTrait,
+    escape,
+    renderInputs,
+    renderOutputs
 )
\ No newline at end of file
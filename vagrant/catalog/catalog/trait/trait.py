@@ -7,10 +7,40 @@ a value assigned to them, yet.
 The asOutputElement method is used for displaying trait values.
 The asInputElement method is used for creating html forms from the trait's attributes.
 
+The renderInputs and renderOutputs functions render a whole list of Traits
+as the rows of a table in a single pass.  Each Trait appends the precompiled
+fragments of its row to one list, which is joined once, and every name and
+value is HTML escaped.
+
 '''
 from abc import ABCMeta, abstractmethod
 import datetime
 
+
+def escape(value):
+    '''Escape a value for use as HTML text or as a quoted attribute value.
+
+    :param value: The value to escape.  Values that aren't strings are
+        converted to one first.
+    :returns: The value with &, <, >, " and ' replaced by HTML entities.
+    :rtype: string
+    '''
+    if not isinstance(value, basestring):
+        value = unicode(value)
+
+    return value.replace(
+        '&', '&amp;'
+    ).replace(
+        '<', '&lt;'
+    ).replace(
+        '>', '&gt;'
+    ).replace(
+        '"', '&quot;'
+    ).replace(
+        "'", '&#39;'
+    )
+
+
 class Trait(object):
     '''Abstract Base Class that defines the Interface and a few attributes of
     all Derived Traits.
@@ -20,25 +50,28 @@ class Trait(object):
         is processed as part of a Request, then the Trait's name is used
         as a key to retrieve it's value from the Request's form.
 
+    .. note::
+        Traits are created for every form and view, so they only hold the
+        attributes named in __slots__.
+
     :param string inputType: The html input type of the trait.
-    :param string inputTemplate: Input Template used when the trait can
-        receive input.
-    :param string outputTemplate: The output template when the trait is only
-        viewed.
-
-    :param str traitTemplate: The base template applied to the input or
-        output templates.  It represents an HTML table row with two
-        table data elements.  One for the Trait's property name and the 
-        other for it's value.
+    :param string rowStart: The fragment that opens an HTML table row and
+        the table data element for the Trait's property name.
+    :param string rowMiddle: The fragment between the property name and the
+        table data element for it's value.
+    :param string rowEnd: The fragment that closes the value's table data
+        element and the row.
     '''
+    __slots__ = ()
+
     inputType = ""
-    inputTemplate = ""
-    outputTemplate = ""
-    traitTemplate = '''
+    rowStart = '''
                 <tr class="trait">
-                    <td>{0}</td>
+                    <td>'''
+    rowMiddle = '''</td>
                     <td>
-                        {1}
+                        '''
+    rowEnd = '''
                     </td>
                 </tr>'''
 
@@ -52,40 +85,75 @@ class Trait(object):
         '''Does this Trait refer to an Image element?
 
         :returns: True if the Trait applies to an Image, otherwise False.
-        :rtype: Boolean
-        '''
+        :rtype: Boolean
+        '''
         pass
 
 
     @abstractmethod
-    def asInputElement(self, formName, withValue = False):
-        '''Render the Trait as an HTML element as part of a form that receives
-        input.
+    def inputParts(self, parts, formName, withValue = False):
+        '''Append the fragments of the Trait's HTML element, as part of a
+        form that receives input, to a list.
 
+        :param list parts: The fragments of the HTML being rendered.
         :param string formName: The HTML form's name attribute.
             Each trait's html element is added to a table outside it's
             form.  This argument binds the Trait's element to the form.
 
         :param Boolean withValue: A form for a new object will not have any
             values.  But a form that is for editing an existing object will.
-
-        :returns: The formatted output of the combination of the
-            inputTemplate and traitTemplate.
-        :rtype: string
-        '''
+        '''
         pass
 
 
     @abstractmethod
+    def outputParts(self, parts):
+        '''Append the fragments of the Trait's HTML element, as a view that
+        does not receive any input, to a list.
+
+        :param list parts: The fragments of the HTML being rendered.
+        '''
+        pass
+
+
+    def asInputElement(self, formName, withValue = False):
+        '''Render the Trait as an HTML element as part of a form that receives
+        input.
+
+        :param string formName: The HTML form's name attribute.
+        :param Boolean withValue: A form for a new object will not have any
+            values.  But a form that is for editing an existing object will.
+
+        :returns: The table row containing the Trait's input element.
+        :rtype: string
+        '''
+        parts = []
+        self.inputParts(parts, formName, withValue)
+        return ''.join(parts)
+
+
     def asOutputElement(self):
         '''Render the Trait as an HTML element as a view that does not receive
         any input.
 
-        :returns: The formatted output of the combination of the
-            outputTemplate and traitTemplate.
-        :rtype: string
-        '''
-        pass
+        :returns: The table row containing the Trait's value.
+        :rtype: string
+        '''
+        parts = []
+        self.outputParts(parts)
+        return ''.join(parts)
+
+
+    def valueParts(self, parts, value):
+        '''Append a table row of the Trait's property name and a value that
+        is escaped as HTML text.'''
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            escape(value),
+            self.rowEnd
+        ))
 
 
 class TextTrait(Trait):
@@ -93,16 +161,15 @@ class TextTrait(Trait):
     unalterable string value in an html element.
 
     :param string inputType: This will be a 'text' input element.
-    :param string inputTemplate: Generate's an html input of type 'text'
     :param string name: The property name or label
     :param string value: The value associated with the property.
 
     '''
+    __slots__ = ('name', 'value')
 
-    inputTemplate = '''<input type="{0}" name="{1}" form="{2}" value="{3}">'''
+    inputType = "text"
 
     def __init__(self, name, value=""):
-        self.inputType = "text"
         self.name = name
         self.value = value
 
@@ -111,57 +178,53 @@ class TextTrait(Trait):
         '''Does this Trait refer to an Image element?
 
         :returns: A text input is not an image, so False.
-        :rtype: Boolean
-        '''
+        :rtype: Boolean
+        '''
         return False
 
 
-    def asInputElement(self, formName, withValue = False):
+    def inputParts(self, parts, formName, withValue = False):
         '''Render the Trait as a text input in as part of an HTML form.
 
-        :param string formName: The HTML form's name attribute.
-        :param Boolean withValue: A form for a new object will not have any
-            values.  But a form that is for editing an existing object will.
-
-        :returns: The formatted output of the combination of the
-            inputTemplate and traitTemplate.
-        :rtype: string
-        '''
+        Refer to :py:meth:`~Trait.inputParts`
+        '''
         value = ""
 
         if withValue == True:
             # Add the trait's value to the second data element
             value = self.value
 
-        # Generate the html for the text input.
-        element =  self.inputTemplate.format(
-                self.inputType,
-                self.name,
-                formName,
-                value
-            )
-
         # Inject the text input element and it's value into a table row.
-        return self.traitTemplate.format(self.name.title(), element)
-
-
-    def asOutputElement(self):
-        """Refer to :py:meth:`~Trait.asOutputElement`"""
-        return self.traitTemplate.format(self.name.title(), self.value)
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            '<input type="',
+            self.inputType,
+            '" name="',
+            escape(self.name),
+            '" form="',
+            escape(formName),
+            '" value="',
+            escape(value),
+            '">',
+            self.rowEnd
+        ))
+
+
+    def outputParts(self, parts):
+        """Refer to :py:meth:`~Trait.outputParts`"""
+        self.valueParts(parts, self.value)
 
 
 class ImageTrait(Trait):
     '''A Trait that represents an HTML image element.
 
-    :param string inputType: This will be a 'text' input element.
-    :param string inputTemplate: Generate's an html input of type 'text'
     :param string name: The property name for the element. Used
         to retrieve data from the form in a request.
     :param string url: The url associated with the image.
     '''
-
-    inputTemplate = '''<input type="{0}" name="{1}" form="{2}" value="{3}">'''
-    outputTemplate = '''<img src="{0}" class="img-responsive">'''
+    __slots__ = ('name', 'url')
 
 
     def __init__(self, name, url=""):
@@ -173,8 +236,8 @@ class ImageTrait(Trait):
             in the local file system or on the web.
         :returns: An ImageTrait containing information associated with a
             property.
-        :rtype: ImageTrait
-        '''
+        :rtype: ImageTrait
+        '''
         self.name = name
         self.url = url
 
@@ -183,42 +246,49 @@ class ImageTrait(Trait):
         '''Does this Trait refer to an Image element?
 
         :returns: This will be an image element, so True.
-        :rtype: Boolean
-        '''
+        :rtype: Boolean
+        '''
         return True
 
 
-    def asInputElement(self, formName, withValue = False):
+    def inputParts(self, parts, formName, withValue = False):
         '''Render the Trait as a text input in as part of an HTML form.
         Manually enter the URL for an image, as opposed to uploading it.
 
-        :param string formName: The HTML form's name attribute.
-        :param Boolean withValue: A form for a new object will not have any
-            values.  But a form that is for editing an existing object will.
-        :returns: The formatted output of the combination of the inputTemplate
-            and traitTemplate.
-        :rtype: string
-        '''
+        Refer to :py:meth:`~Trait.inputParts`
+        '''
         value = ""
 
         if withValue == True:
             # Add the trait's value to the second data element
             value = self.url
 
-        # Generate the html for the text input.
-        element =  self.inputTemplate.format(
-                "text",
-                self.name,
-                formName,
-                value
-            )
-        # Inject the results into a table row and return the result.
-        return self.traitTemplate.format(self.name.title(), element)
-
-
-    def asOutputElement(self):
-        """Refer to :py:meth:`~Trait.asOutputElement`"""
-        return self.outputTemplate.format(self.url)
+        # Inject the text input into a table row.
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            '<input type="text" name="',
+            escape(self.name),
+            '" form="',
+            escape(formName),
+            '" value="',
+            escape(value),
+            '">',
+            self.rowEnd
+        ))
+
+
+    def outputParts(self, parts):
+        '''An image is output on it's own, not in a table row.
+
+        Refer to :py:meth:`~Trait.outputParts`
+        '''
+        parts.extend((
+            '<img src="',
+            escape(self.url),
+            '" class="img-responsive">'
+        ))
 
 
 class ImageUploadTrait(Trait):
@@ -229,12 +299,10 @@ class ImageUploadTrait(Trait):
         files of any type. This Trait is only used for Input.  An
         ImageTrait should be used for outputting an image.
 
-    :param string inputType: This will be a 'text' input element.
-    :param string inputTemplate: Generate's an html input of type 'text'
     :param string name: The property name for the element. Used
         to retrieve data from the form in a request.
     '''
-    inputTemplate = '''<input type="{0}" name="{1}" form="{2}">'''
+    __slots__ = ('name',)
 
     def __init__(self, name):
         '''Create an ImageUploadTrait given the name of it's property/label
@@ -244,8 +312,8 @@ class ImageUploadTrait(Trait):
                 the form contained in the request.
 
         :returns: An ImageUploadTrait
-        :rtype: Trait
-        '''
+        :rtype: Trait
+        '''
         self.name = name
 
 
@@ -254,60 +322,50 @@ class ImageUploadTrait(Trait):
 
         :returns: This is not displayed as an image but as a file upload
             input, so False.
-        :rtype: Boolean
-        '''
+        :rtype: Boolean
+        '''
         return False
 
 
-    def asInputElement(self, formName, withValue = False):
+    def inputParts(self, parts, formName, withValue = False):
         '''Render as a file upload element in an HTML form.
 
-        Prompts the user to choose a file on their system to upload.
+        Prompts the user to choose a file on their system to upload.  The
+        row contains the property name and a file input, which shows the
+        file's name after the user chooses an image file.
 
-        :param string formName: The HTML form's name attribute.
-        :param Boolean withValue: A form for a new object will not have any
-            values.  But a form that is for editing an existing object will.
-        :returns: Formatted HTML table row containing two table data elements
-            containing the property name in a button and an empty text element
-            that will hold the file's name after the user uploads an image
-            file.
-        :rtype: string
-
+        Refer to :py:meth:`~Trait.inputParts`
         '''
-
-        # Return the File upload element with the button containing the
-        # property name for the input.
-        element =  self.inputTemplate.format(
-                "file",
-                self.name,
-                formName
-            )
-        return self.traitTemplate.format(self.name.title(), element)
-
-
-    def asOutputElement(self):
-        '''An Image Upload element would not be presented as an Image.
-
-        :returns: An HTML comment describing the Output Usage for
-            ImageUploadTrait
-        :rtype: string
-        '''
-        return "<--! ImageUploadTrait not used for output -->"
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            '<input type="file" name="',
+            escape(self.name),
+            '" form="',
+            escape(formName),
+            '">',
+            self.rowEnd
+        ))
+
+
+    def outputParts(self, parts):
+        '''An Image Upload element would not be presented as an Image, so an
+        HTML comment describing the Output Usage for ImageUploadTrait is
+        output instead.'''
+        parts.append("<--! ImageUploadTrait not used for output -->")
 
 
 class TextAreaTrait(Trait):
     '''A Trait for a multi-line text property that is rendered as a TextArea
     HTML element.
 
-    :param inputTemplate: Generate's an html 'textarea' input.
     :param name: The label or property name.
     :param value: The value contained in the textarea.
-    :type inputTemplate: string
     :type name: string
     :type value: string
     '''
-
-    inputTemplate = '''<textarea name="{0}" form="{1}">{2}</textarea>'''
+    __slots__ = ('name', 'value')
 
     def __init__(self, name, value=""):
         '''Create a TextAreaTrait given it's property name and value.
@@ -335,40 +393,38 @@ class TextAreaTrait(Trait):
         return False
 
 
-    def asInputElement(self, formName, withValue = False):
+    def inputParts(self, parts, formName, withValue = False):
         '''Render as a textarea element in an HTML form.
 
-        Provides an area for a longer text description of a property.
-
-        :param formName: The HTML form's name attribute.
-        :param withValue: True builds a form for creating a new object
-            that will not have any values.  False, a form that is for
-            editing an existing object will.
-        :type formName: string
-        :type withValue: Boolean
-        :return string: HTML that defines a table row containing two table data
-            elements. One for the property name as a label and another that
-            contains the Trait's value (or nothing) in a textarea HTML element.
+        Provides an area for a longer text description of a property.  The
+        row contains the property name as a label and the Trait's value (or
+        nothing) in a textarea HTML element.
 
+        Refer to :py:meth:`~Trait.inputParts`
         '''
         value = ""
 
         if withValue == True:
             value = self.value
 
-        # Generate a label and a textarea in two table data elements of a row
-        # in HTML and return the resulting string.
-        element = self.inputTemplate.format(
-            self.name,
-            formName,
-            value
-        )
-        return self.traitTemplate.format(self.name.title(), element)
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            '<textarea name="',
+            escape(self.name),
+            '" form="',
+            escape(formName),
+            '">',
+            escape(value),
+            '</textarea>',
+            self.rowEnd
+        ))
 
 
-    def asOutputElement(self):
-        """Refer to :py:meth:`~Trait.asOutputElement`"""
-        return self.traitTemplate.format(self.name.title(), self.value)
+    def outputParts(self, parts):
+        """Refer to :py:meth:`~Trait.outputParts`"""
+        self.valueParts(parts, self.value)
 
 
 
@@ -376,9 +432,12 @@ class SelectTrait(Trait):
     '''A Trait for a property that is best represented by a Select Element
     with a Dropdown list of different options to choose from.
 
-    :param string selectTemplate: Generate's an html 'select' input.
-    :param string optionTemplate: A template string that represents one
-        option element contained in a select element.
+    .. note::
+        The option elements for a list of options are rendered once and kept
+        in optionCache, since every form for an Item lists every Category.
+        Rendering a select then only swaps in the selected option.
+
+    :param int optionCacheSize: The most lists of options kept rendered.
     :param string name: The label or property name.
     :param string value: The string value of the currently selected
         option.
@@ -386,11 +445,10 @@ class SelectTrait(Trait):
         each option displayed in the drop down list of the select element.
 
     '''
-    selectTemplate = '''<select name="{0}" form="{1}">{2}
-                        </select>'''
+    __slots__ = ('name', 'value', 'options')
 
-    optionTemplate = '''
-                            <option value="{0}"{1}>{2}</option>'''
+    optionCacheSize = 32
+    optionCache = {}
 
     def __init__(self, name, value, options):
         '''Create a SelectTrait given it's property name and value.
@@ -401,7 +459,7 @@ class SelectTrait(Trait):
             long/detailed description of something.
         :returns: A SelectTrait containing options, possibly including a
             currently selected option, for a property.
-        :rtype: Trait
+        :rtype: Trait
 
         '''
         self.name = name
@@ -409,89 +467,135 @@ class SelectTrait(Trait):
         self.options = options
 
 
+    @classmethod
+    def renderOptions(cls, options):
+        '''The rendered option elements for a list of options.
+
+        :param list options: The value of each option.
+        :returns: The option elements, the same elements marked as selected,
+            and the positions of each value in the list.
+        :rtype: tuple
+        '''
+        key = tuple(options)
+        rendered = cls.optionCache.get(key)
+
+        if rendered is None:
+            plain = []
+            selected = []
+            positions = {}
+
+            for position, option in enumerate(key):
+                value = escape(option)
+                title = escape(option.title())
+
+                plain.append(''.join((
+                    '\n                            <option value="',
+                    value,
+                    '">',
+                    title,
+                    '</option>'
+                )))
+                selected.append(''.join((
+                    '\n                            <option value="',
+                    value,
+                    '" selected>',
+                    title,
+                    '</option>'
+                )))
+                positions.setdefault(option, []).append(position)
+
+            rendered = (plain, selected, positions)
+
+            if len(cls.optionCache) >= cls.optionCacheSize:
+                cls.optionCache.clear()
+
+            cls.optionCache[key] = rendered
+
+        return rendered
+
+
     def isImage(self):
         '''Does this Trait refer to an Image element?
 
         :returns: A Select element is not an image, so False.
-        :rtype: Boolean
-        '''
+        :rtype: Boolean
+        '''
         return False
 
 
-    def asInputElement(self, formName, withValue = False):
+    def inputParts(self, parts, formName, withValue = False):
         '''Render as a Select element containing option elements in an HTML
         form.
 
         Provides an dropdown list of options to choose from return the selected
-        value as part of a form in a Request.
-
-        :param string formName: The HTML form's name attribute.
-        :param Boolean withValue: A form for a new object will not have any
-            values.  But a form that is for editing an existing object will.
-        :returns: Formatted HTML table row containing two table data
-            elements. One for the property name as a label and another that
-            contains the the Select with a dropdown list of options to choose
-            from.
-        :rtype: string
+        value as part of a form in a Request.  The row contains the property
+        name as a label and the Select with a dropdown list of options to
+        choose from.
 
+        Refer to :py:meth:`~Trait.inputParts`
         '''
-        options = ""
-
-        # Compile the options for the dropdown list first...
-        for option in self.options:
-            selected = ""
+        plain, selected, positions = self.renderOptions(self.options)
 
-            # The value will be the selected option
-            if option == self.value:
-                selected = " selected"
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            '<select name="',
+            escape(self.name),
+            '" form="',
+            escape(formName),
+            '">'
+        ))
 
-            options += self.optionTemplate.format(
-                option,
-                selected,
-                option.title()
-            )
+        # The value will be the selected option, and the options around it
+        # are added as they were rendered.
+        start = 0
 
+        for position in positions.get(self.value, ()):
+            parts.extend(plain[start:position])
+            parts.append(selected[position])
+            start = position + 1
 
-        # Now combine the options with the select
-        element = self.selectTemplate.format(
-            self.name,
-            formName,
-            options
-        )
+        parts.extend(plain[start:])
+        parts.extend((
+            '\n                        </select>',
+            self.rowEnd
+        ))
 
-        # Return the final result.
-        return self.traitTemplate.format(self.name.title(), element)
 
-
-    def asOutputElement(self):
-        """Refer to :py:meth:`~Trait.asOutputElement`"""
-        return self.traitTemplate.format(self.name.title(), self.value)
+    def outputParts(self, parts):
+        """Refer to :py:meth:`~Trait.outputParts`"""
+        self.valueParts(parts, self.value)
 
 
 class DateTrait(Trait):
     '''A Trait for a property that is best represented as a date that includes
     the year, month and day.
 
-    :param string inputTemplate: Template for Generating an html 'date' input.
+    :param string inputType: This will be a 'date' input element.
     :param string name: The label or property name.
     :param string value: The date value associated with the property.
 
     '''
-    inputTemplate = '''<input type="date" name="{0}" form="{1}" value="{2}">'''
+    __slots__ = ('name', 'value')
 
+    inputType = "date"
 
-    def __init__(self, name, value=str(datetime.date.today())):
+
+    def __init__(self, name, value=None):
         '''Create a DateTrait given it's property name and value as a Date.
 
         :param string name: The name of the property for the label and key in
             the form contained in the request.
-        :param string value: A Date
+        :param string value: A Date, defaults to today's date.
         :returns: A DateTrait containing options, possibly including a
             currently selected option, for a property.
-        :rtype: Trait
+        :rtype: Trait
 
         '''
-        self.inputType = "date"
+        if value is None:
+            value = str(datetime.date.today())
+
         self.name = name
         self.value = value
 
@@ -500,40 +604,81 @@ class DateTrait(Trait):
         '''Does this Trait refer to an Image element?
 
         :returns: A Date input element is not an image, so False.
-        :rtype: Boolean
-        '''
+        :rtype: Boolean
+        '''
         return False
 
 
-    def asInputElement(self, formName, withValue = False):
+    def inputParts(self, parts, formName, withValue = False):
         '''Render as an HTML date input element.
 
         Provides a calender like functionality or manually inputting the
-        year, month and day.
-
-        :param string formName: The HTML form's name attribute.
-        :param Boolean withValue: A Date Trait always presents a date value,
-            either a default that is today's date, or one passed in.
-        :returns: Formatted HTML table row containing two table data
-            elements. One for the property name as a label and another that
-            contains the Date input set to today's date or the date passed
-            during the creation of the object.
-        :rtype: string
+        year, month and day.  A Date Trait always presents a date value,
+        either a default that is today's date, or one passed in, whatever
+        withValue is.
 
+        Refer to :py:meth:`~Trait.inputParts`
         '''
+        parts.extend((
+            self.rowStart,
+            escape(self.name.title()),
+            self.rowMiddle,
+            '<input type="date" name="',
+            escape(self.name),
+            '" form="',
+            escape(formName),
+            '" value="',
+            escape(self.value),
+            '">',
+            self.rowEnd
+        ))
+
+
+    def outputParts(self, parts):
+        """Refer to :py:meth:`~Trait.outputParts`"""
+        self.valueParts(parts, self.value)
+
+
+def renderInputs(traits, formName, withValue = False, skipImages = False):
+    '''Render a list of Traits as the rows of a form's table in one pass.
+
+    :param list traits: The Traits to render, in order.
+    :param string formName: The HTML form's name attribute.
+    :param Boolean withValue: True for a form that edits an existing object.
+    :param Boolean skipImages: True leaves out the Traits that refer to an
+        Image element, which are displayed outside the table.
+    :returns: The table rows of every Trait's input element.
+    :rtype: string
+    '''
+    parts = []
 
-        # Generate the Date input element.
-        element = self.inputTemplate.format(
-            self.name,
-            formName,
-            self.value
-        )
+    for trait in traits:
+        if skipImages and trait.isImage():
+            continue
 
-        # Combine a label and the Date input element into a table row and
-        # return the result.
-        return self.traitTemplate.format(self.name.title(), element)
+        trait.inputParts(parts, formName, withValue)
 
+    return ''.join(parts)
 
-    def asOutputElement(self):
-        """Refer to :py:meth:`~Trait.asOutputElement`"""
-        return self.traitTemplate.format(self.name.title(), self.value)
+
+def renderOutputs(traits, exclude = ()):
+    '''Render a list of Traits as the rows of a view's table in one pass.
+
+    .. note::
+        Traits that refer to an Image element are displayed outside the
+        table, so they are left out.
+
+    :param list traits: The Traits to render, in order.
+    :param tuple exclude: The names of Traits to leave out.
+    :returns: The table rows of every Trait's value.
+    :rtype: string
+    '''
+    parts = []
+
+    for trait in traits:
+        if trait.isImage() or trait.name in exclude:
+            continue
+
+        trait.outputParts(parts)
+
+    return ''.join(parts)
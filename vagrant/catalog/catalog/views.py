@@ -19,19 +19,26 @@ modules and code.
 '''
 from datetime import datetime
 import os
+import uuid
 
 from flask import (
+    abort,
     render_template,
     url_for,
     request,
     redirect,
     flash,
+    json,
     jsonify,
+    stream_with_context,
     Response
 )
 
-from sqlalchemy import desc
-from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
+from sqlalchemy.orm.exc import (
+    MultipleResultsFound,
+    NoResultFound,
+    StaleDataError
+)
 from werkzeug import secure_filename
 from database import session
 
@@ -48,10 +55,28 @@ from auth import (
     ConnectGoogle,
     DisconnectGoogle,
     canAlter,
-    getSessionUserInfo
+    getSessionUserInfo,
+    isAdminSession,
+    generate_csrf_token
 )
 
 from urls import Urls
+from trait import renderInputs, renderOutputs
+from pagination import paginate
+from cache import (
+    categoryVersion,
+    catalogVersion,
+    userVersion,
+    DailyVersion,
+    VersionedCache,
+    fragmentCache
+)
+from xmlwriter import streamCatalogXML, gzipStream
+from instrumentation import recentRequestStats
+from metrics import exposition
+from profiling import issueToken, MODES as PROFILE_MODES
+from sampler import sampler
+from memory import memoryTracker
 from app import app
 
 
@@ -101,6 +126,265 @@ def processImageUpload(image):
         return os.path.join("images", filename)
 
 
+def paginateList(query, columns, descending=False):
+    """Read the page of a list route's query requested by the web client.
+
+    Note:
+        The page is chosen by the after or before cursor and the size given
+        in the request's query parameters.  Refer to
+        :py:func:`~pagination.paginate`
+
+    Args:
+        query (Query):          The query for the records in the list.
+        columns (list):         The columns to order the records by, ending
+            with the primary key.
+        descending (Boolean):   Order the records in descending order.
+
+    Returns:
+        Page: The records on the requested page.  Responds with a 400 error
+        if a cursor is invalid.
+
+    """
+    size = request.args.get('size', app.config['PAGE_SIZE'], type=int)
+    size = max(1, min(size, app.config['MAX_PAGE_SIZE']))
+
+    try:
+        return paginate(
+            query,
+            columns,
+            descending,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            size=size
+        )
+
+    except ValueError:
+        abort(400)
+
+
+def catalogStreamFormat():
+    """Determine which streaming format, if any, a request for the Catalog
+    asked for.
+
+    Note:
+        A client can ask for a stream with the stream query parameter
+        (?stream=json or ?stream=ndjson), or for NDJSON by accepting the
+        application/x-ndjson or application/ndjson mimetypes.
+
+    Returns:
+        'json' for a streamed JSON document, 'ndjson' for newline delimited
+        JSON or None when the response shouldn't be streamed.
+
+    """
+    stream = request.args.get('stream')
+
+    if stream in ('json', 'ndjson'):
+        return stream
+
+    accepted = [mimetype for mimetype, quality in request.accept_mimetypes]
+
+    if 'application/x-ndjson' in accepted or 'application/ndjson' in accepted:
+        return 'ndjson'
+
+
+def streamCatalogJSON(categories):
+    """Write the Catalog as a JSON document, one Category at a time.
+
+    Args:
+        categories (iterable): The serialized Categories to write.
+
+    Returns:
+        A generator of strings that together form the same document as
+        jsonify(Catalog=categories).
+
+    """
+    yield '{"Catalog": ['
+
+    separator = ''
+    for category in categories:
+        yield separator + json.dumps(category)
+        separator = ', '
+
+    yield ']}\n'
+
+
+def streamCatalogNDJSON(categories):
+    """Write the Catalog as newline delimited JSON, one Category per line.
+
+    Args:
+        categories (iterable): The serialized Categories to write.
+
+    Returns:
+        A generator of strings, each a line containing one Category.
+
+    """
+    for category in categories:
+        yield json.dumps(category) + '\n'
+
+
+def catalogValidators(variant):
+    """The ETag and Last-Modified date of a representation of the Catalog.
+
+    Note:
+        Both come from catalogVersion, which is kept in the database, so
+        they are the same in every process and are known before the
+        Catalog itself is queried.  Each representation of the same data,
+        such as a gzipped or streamed one, has its own ETag.
+
+    Args:
+        variant (string): Names the representation.
+
+    Returns:
+        A tuple of the ETag and the Last-Modified datetime, or None.
+
+    """
+    tag, lastModified = catalogVersion.validators()
+    return ("%s-%s" % (tag, variant), lastModified)
+
+
+def itemValidators(version):
+    """The ETag and Last-Modified date of an Item's JSON.
+
+    Note:
+        The ETag comes from the Item's version and userVersion, as the
+        JSON includes the name of the Item's creator.  Both are kept in the
+        database, so the ETag is the same in every process.  The
+        Last-Modified date is that of the whole Catalog, which changes
+        whenever the Item or its creator does.
+
+    Args:
+        version (int): The version of the Item.
+
+    Returns:
+        A tuple of the ETag and the Last-Modified datetime, or None.
+
+    """
+    tag = userVersion.validators()[0]
+    lastModified = catalogVersion.validators()[1]
+    return ("%s-item-%d" % (tag, version), lastModified)
+
+
+def setValidators(response, etag, lastModified):
+    """Add the ETag and Last-Modified headers to a response.
+
+    Note:
+        Last-Modified is left out when lastModified is None, since
+        Werkzeug sets it to the current time instead.
+
+    Returns:
+        The response.
+
+    """
+    response.set_etag(etag)
+
+    if lastModified is not None:
+        response.last_modified = lastModified
+
+    return response
+
+
+def notModified(etag, lastModified):
+    """Check whether the client's copy of a representation is current.
+
+    Note:
+        If-None-Match is used when the request has it, otherwise
+        If-Modified-Since.
+
+    Args:
+        etag (string):          The representation's current ETag.
+        lastModified (datetime): The time it last changed, in UTC, or None
+            if it can't be compared yet.
+
+    Returns:
+        A 304 response when the copy is current, otherwise None.
+
+    """
+    if request.if_none_match:
+        current = request.if_none_match.contains_weak(etag)
+
+    elif request.if_modified_since and lastModified is not None:
+        current = lastModified <= request.if_modified_since
+
+    else:
+        current = False
+
+    if not current:
+        return None
+
+    return setValidators(Response(status=304), etag, lastModified)
+
+
+def isCurrentVersion(record):
+    """Check that an edit form was loaded at a record's current version.
+
+    Note:
+        A form without a version is accepted, as it was loaded before
+        records had versions.
+
+    Args:
+        record: The Item or Category being edited.
+
+    Returns:
+        False if the record has been changed since the form was loaded.
+
+    """
+    version = request.form.get('version')
+    return version is None or version == str(record.version)
+
+
+# Tells a user their edit wasn't saved, because someone else saved theirs.
+STALE_EDIT_MESSAGE = "{0} was changed while you were editing it.  " \
+    "Review the changes and edit it again."
+STALE_DELETE_MESSAGE = "{0} was changed or deleted while you were deleting " \
+    "it.  Nothing was deleted."
+
+
+# Stands in for the CSRF token in a cached form, which is shared by sessions.
+# It is chosen at random when the process starts, so the data in the form,
+# such as the names of the Categories, can't contain it.
+CSRF_PLACEHOLDER = uuid.uuid4().hex
+
+
+def renderNewItemForm():
+    """Render the body of the form for a new Item, without a CSRF token.
+
+    Notes:
+        The form lists every Category and defaults its date to today, so it
+        is cached by newItemForm until a Category is created, changed or
+        deleted, by any process, or the day rolls over.
+
+    Returns:
+        A tuple of the HTML before and after the form's CSRF token.
+
+    """
+    html = render_template(
+        os.path.join("partials", "new.html"),
+        modelType="item",
+        traits=Item.defaultTraits(),
+        csrf_token=lambda: CSRF_PLACEHOLDER
+    )
+    before, placeholder, after = html.partition(CSRF_PLACEHOLDER)
+    assert placeholder, "The new item form has no CSRF token"
+
+    return (before, after)
+
+
+newItemForm = VersionedCache(
+    DailyVersion(categoryVersion),
+    renderNewItemForm,
+    'newItemForm'
+)
+
+
+# The sidebar links to every Category on every page, so it is rendered once
+# for each version of the Categories.
+fragmentCache.register(
+    'sidebar',
+    categoryVersion,
+    lambda: render_template(os.path.join("partials", "categories.html"))
+)
+
+
 @app.context_processor
 def makeurls_processor():
     def makeUrls(suffix, key=0):
@@ -147,6 +431,14 @@ def canalter_processor():
     return dict(canAlter=canAlter)
 
 
+# Render the Traits of a form or view in one pass
+@app.context_processor
+def rendertraits_processor():
+    """Refer to :py:func:`~trait.renderInputs` and
+    :py:func:`~trait.renderOutputs`"""
+    return dict(renderInputs=renderInputs, renderOutputs=renderOutputs)
+
+
 
 @app.context_processor
 def getplural_processor():
@@ -172,6 +464,12 @@ def getplural_processor():
     return dict(getPlural=getPlural)
 
 
+@app.context_processor
+def fragment_processor():
+    """Refer to :py:meth:`~cache.FragmentCache.render`"""
+    return dict(fragment=fragmentCache.render)
+
+
 @app.context_processor
 def getcategories_processor():
     def getCategoryNames():
@@ -341,17 +639,17 @@ def listUser():
     """Present the Web User with an Edit View for the their User account.
 
     Returns:
-        Presents the user with a list of all user Names
+        Presents the user with a page of the list of all user Names
     """
-    users = User.query.all()
+    users = paginateList(User.query, [User.name, User.id])
 
     return render_template(
         'generic.html',
         modelType="user",
         viewType=os.path.join("partials", 'list.html'),
         objects=users,
-        client_id=CLIENT_ID,
-        state=getLoginSessionState()
+        page=users,
+        client_id=CLIENT_ID
     )
 
 
@@ -448,11 +746,24 @@ def editCategory(key):
 
     # Process the Edit Form when it is Submitted.
     if request.method == 'POST':
+        # Don't overwrite changes saved since the form was loaded.
+        if not isCurrentVersion(editCategory):
+            flash(STALE_EDIT_MESSAGE.format(editCategory.name))
+            return redirect(url_for('editCategory', key=key))
 
         editCategory.name = request.form['name']
 
         session.add(editCategory)
-        session.commit()
+
+        try:
+            session.commit()
+
+        except StaleDataError:
+            # The category was saved by another request since it was read
+            # by this one.
+            session.rollback()
+            flash(STALE_EDIT_MESSAGE.format(request.form['name']))
+            return redirect(url_for('editCategory', key=key))
 
         flash("Category edited!")
         return redirect(url_for('viewCategory', key=key))
@@ -463,6 +774,7 @@ def editCategory(key):
             modelType="category",
             viewType=os.path.join("partials", 'edit.html'),
             key=key,
+            version=editCategory.version,
             traits=editCategory.traits(),
             allowAlter=canAlter(editCategory.user_id)
         )
@@ -496,8 +808,18 @@ def deleteCategory(key):
 
     # Remove the Category from the Database
     if request.method == 'POST':
+        name = deleteCategory.name
         session.delete(deleteCategory)
-        session.commit()
+
+        try:
+            session.commit()
+
+        except StaleDataError:
+            # The category, or one of its items, was saved or deleted by
+            # another request since it was read by this one.
+            session.rollback()
+            flash(STALE_DELETE_MESSAGE.format(name))
+            return redirect(url_for('listCategory'))
 
         flash("Category deleted!")
         # Back to the List of Categories
@@ -520,17 +842,17 @@ def listCategory():
     """A View containing the list of Categories.
 
     Returns:
-        Presents the user with a list of all user Categories
+        Presents the user with a page of the list of all user Categories
     """
-    categories = Category.query.all()
+    categories = paginateList(Category.query, [Category.name, Category.id])
 
     return render_template(
         'generic.html',
         modelType="category",
         viewType=os.path.join("partials", "list.html"),
         objects=categories,
-        client_id=CLIENT_ID,
-        state=getLoginSessionState()
+        page=categories,
+        client_id=CLIENT_ID
     )
 
 
@@ -669,12 +991,15 @@ def newItem():
             # Send the user back to the newItem Form.
             return redirect(url_for('newItem'))
     else:
-        # Present the User with the New Item Form
+        # Present the User with the New Item Form, rendered once and shared
+        # by every session but for the session's CSRF token.
+        before, after = newItemForm.get()
+
         return render_template(
             'generic.html',
             modelType="item",
             viewType=os.path.join("partials", "new.html"),
-            traits=Item.defaultTraits()
+            viewBody=before + generate_csrf_token() + after
         )
 
 
@@ -722,6 +1047,7 @@ def editCatItem(category_name, item_name):
         category=category_name,
         key=item.id,
         name=item.name,
+        version=item.version,
         traits=item.traits(True),
         allowAlter=canAlter(item.user_id)
     )
@@ -753,6 +1079,11 @@ def editItem(key):
         item = Item.query.filter_by(id=key).one()
 
         if request.method == 'POST':
+            # Don't overwrite changes saved since the form was loaded.
+            if not isCurrentVersion(item):
+                flash(STALE_EDIT_MESSAGE.format(item.name))
+                return redirect(url_for('editItem', key=key))
+
             # Make sure that an item associated with this category doesn't already have
             # the name of the one submitted in the form.
             category = Category.query.filter_by(name=request.form['category']).one()
@@ -796,7 +1127,16 @@ def editItem(key):
                 item.description = request.form['description']
 
                 session.add(item)
-                session.commit()
+
+                try:
+                    session.commit()
+
+                except StaleDataError:
+                    # The item was saved by another request since it was
+                    # read by this one.
+                    session.rollback()
+                    flash(STALE_EDIT_MESSAGE.format(itemName))
+                    return redirect(url_for('editItem', key=key))
 
                 flash("Item edited!")
 
@@ -912,8 +1252,18 @@ def deleteItem(key):
 
     if request.method == 'POST':
         # The user submitted this item for deletion.
+        name = deleteItem.name
         session.delete(deleteItem)
-        session.commit()
+
+        try:
+            session.commit()
+
+        except StaleDataError:
+            # The item was saved or deleted by another request since it was
+            # read by this one.
+            session.rollback()
+            flash(STALE_DELETE_MESSAGE.format(name))
+            return redirect(url_for('listItem'))
 
         flash("Item deleted!")
         return redirect(url_for('listItem'))
@@ -939,13 +1289,17 @@ def listCategoryItem(category_name):
         category_name (string): The category of items to be viewed.
 
     Returns:
-        A GET request presents the user with the list of all items belonging to
-        the specified category.
+        A GET request presents the user with a page of the list of all items
+        belonging to the specified category, newest first.
 
     """
     # Find the category by its name, and all Items with that category's id.
-    category = Category.query.filter_by(name=category_name).one()
-    items = Item.query.filter_by(cat_id=category.id).all()
+    cat_id = Category.idByName(category_name)
+    items = paginateList(
+        Item.listing().filter(Item.cat_id == cat_id),
+        [Item.dateCreated, Item.id],
+        descending=True
+    )
 
     # Present the List of Items in the main view.
     return render_template(
@@ -953,8 +1307,8 @@ def listCategoryItem(category_name):
         viewType=os.path.join("partials", "list.html"),
         modelType='item',
         objects=items,
-        client_id=CLIENT_ID,
-        state=getLoginSessionState()
+        page=items,
+        client_id=CLIENT_ID
     )
 
 
@@ -966,22 +1320,19 @@ def listItem():
     """List all Items in the catalog.
 
     Returns:
-        A GET request presents the user with the list of all catalog items.
+        A GET request presents the user with a page of the list of all catalog
+        items.
 
     """
-    # Retrieve the list of items and order them by their creation date.
+    # Retrieve a page of the list of items ordered by their creation date.
     # Starting with the newest and ending with the oldest.
-    items = Item.query.order_by(desc(Item.dateCreated)).all()
-
-    # Generate a list of ( Category Name, Item Name) tuples?
-    # This lets the view display each item with its respective category
-    results = [ (Category.findByID(i.cat_id).name, i.name) for i in items ]
-    objects = []
-
-    # Convert the list to contain a dictionary for each item/category combo.
-    for category, item in results:
-        objects.append({'category': category, 'item': item})
-
+    # Each item is loaded with its category, so the view can display the
+    # item with its respective category without another query.
+    items = paginateList(
+        Item.listing(),
+        [Item.dateCreated, Item.id],
+        descending=True
+    )
 
     # Present the list of all items and their categories in the main view.
     return render_template(
@@ -989,8 +1340,8 @@ def listItem():
         viewType=os.path.join("partials", "list.html"),
         modelType='item',
         objects=items,
-        client_id=CLIENT_ID,
-        state=getLoginSessionState()
+        page=items,
+        client_id=CLIENT_ID
     )
 
 
@@ -998,6 +1349,11 @@ def listItem():
 def itemJSON(key):
     """Return information about a Catalog Item in JSON.
 
+    Note:
+        A request whose copy of the Item is current, by its ETag or
+        Last-Modified date, is answered with 304 Not Modified.  Refer to
+        :py:func:`itemValidators`.
+
     Args:
         key (int): The primary key of the item to retrieve.
 
@@ -1005,22 +1361,72 @@ def itemJSON(key):
         A GET request returns information about an item in JSON
 
     """
-    item = Item.query.filter_by(id=key).one()
+    # Only the Item's version is read to check the client's copy.
+    version = session.query(Item.version).filter(Item.id == key).scalar()
+
+    if version is not None:
+        response = notModified(*itemValidators(version))
 
-    return jsonify(Item=item.serialize)
+        if response is not None:
+            return response
+
+    item = Item.listing().filter(Item.id == key).one()
+
+    return setValidators(
+        jsonify(Item=item.serialize),
+        *itemValidators(item.version)
+    )
 
 
 @app.route('/catalog/JSON')
 def catalogJSON():
     """JSON endpoint that returns information about the entire Catalog.
 
+    Note:
+        Refer to :py:func:`catalogStreamFormat` for requesting a streamed
+        response, which is written as the Catalog is read from the database
+        instead of after all of it has been loaded.
+
+        A request whose copy of the Catalog is current, by its ETag or
+        Last-Modified date, is answered with 304 Not Modified.
+
     Returns:
         A GET request returns the Catalog's information in JSON
 
     """
-    categories = Category.query.all()
-    cats = [c.serialize for c in categories]
-    return jsonify(Catalog=cats)
+    streamFormat = catalogStreamFormat()
+    etag, lastModified = catalogValidators(
+        "json" if streamFormat is None else streamFormat + "-stream"
+    )
+    response = notModified(etag, lastModified)
+
+    if response is None:
+        if streamFormat is None:
+            response = jsonify(Catalog=Category.serializeAll())
+
+        else:
+            categories = Category.iterSerialized(
+                app.config['STREAM_BATCH_SIZE']
+            )
+
+            if streamFormat == 'ndjson':
+                response = Response(
+                    stream_with_context(streamCatalogNDJSON(categories)),
+                    mimetype="application/x-ndjson"
+                )
+
+            else:
+                response = Response(
+                    stream_with_context(streamCatalogJSON(categories)),
+                    mimetype="application/json"
+                )
+
+        setValidators(response, etag, lastModified)
+
+    # The Accept header can ask for NDJSON.
+    response.vary.add('Accept')
+
+    return response
 
 
 # An XML endpoint for the entire catalog
@@ -1028,21 +1434,179 @@ def catalogJSON():
 def catalogXML():
     """XML endpoint that returns information about the entire Catalog.
 
+    Note:
+        The document is written as the Catalog is read from the database.
+        Refer to :py:mod:`~xmlwriter` for its layout.  It is compressed with
+        gzip when the client accepts that encoding.
+
+        A request whose copy of the Catalog is current, by its ETag or
+        Last-Modified date, is answered with 304 Not Modified.
+
     Returns:
         A GET request returns the Catalog's information in XML
 
     """
-    categories = Category.query.all()
-    cats = [c.serialize for c in categories]
+    gzipped = 'gzip' in request.accept_encodings
+    etag, lastModified = catalogValidators("xml-gzip" if gzipped else "xml")
+    response = notModified(etag, lastModified)
+
+    if response is None:
+        categories = Category.iterSerialized(app.config['STREAM_BATCH_SIZE'])
+        xmlCatalog = streamCatalogXML(categories)
+
+        if gzipped:
+            response = Response(
+                stream_with_context(gzipStream(xmlCatalog)),
+                mimetype="text/xml"
+            )
+            response.headers['Content-Encoding'] = 'gzip'
+
+        else:
+            response = Response(
+                stream_with_context(xmlCatalog),
+                mimetype="text/xml"
+            )
 
-    from dicttoxml import dicttoxml as d2xml
-    xmlCatalog = d2xml(cats)
-    print xmlCatalog
+        setValidators(response, etag, lastModified)
 
-    return Response(xmlCatalog, mimetype="text/xml")
+    response.vary.add('Accept-Encoding')
+
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Metrics endpoint for Prometheus.
+
+    Note:
+        Only available when METRICS_ENABLED is set.  Refer to
+        :py:mod:`~metrics` for the metrics exported.
+
+    Returns:
+        A GET request returns the app's metrics in the Prometheus text
+        format.
+
+    """
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+
+    return Response(
+        exposition(),
+        mimetype="text/plain; version=0.0.4"
+    )
+
+
+@app.route('/debug/queries')
+def debugQueries():
+    """JSON endpoint that returns the SQL statements counted for the most
+    recent requests.
+
+    Note:
+        Only available when the app is in debug mode or QUERY_DEBUG is set.
+        Refer to :py:mod:`~instrumentation` for the values reported.
+
+    Returns:
+        A GET request returns the query count, query time and slowest
+        statement of each recent request, newest first.
+
+    """
+    if not (app.debug or app.config['QUERY_DEBUG']):
+        abort(404)
+
+    return jsonify(Requests=recentRequestStats())
+
+
+@app.route('/debug/profile/token')
+def profileToken():
+    """Issue a token for profiling requests to an administrator.
+
+    Note:
+        The mode query parameter picks the profile's output, either pstats
+        or summary (the default).  Refer to :py:mod:`~profiling`.
+
+    Returns:
+        A GET request returns the token in JSON along with the names of the
+        header and query parameter that it can be sent in.
+
+    """
+    if not isAdminSession():
+        abort(404)
+
+    mode = request.args.get('mode', 'summary')
+
+    if mode not in PROFILE_MODES:
+        abort(400)
+
+    return jsonify(
+        token=issueToken(mode),
+        header=app.config['PROFILE_HEADER'],
+        parameter=app.config['PROFILE_PARAMETER']
+    )
+
+
+@app.route('/debug/profile/stacks')
+def profileStacks():
+    """Export the stacks counted by the sampling profiler to an
+    administrator, for drawing flame graphs.
+
+    Note:
+        The endpoint query parameter limits the stacks to one route, and
+        reset discards the stacks counted so far once they are exported.
+        Refer to :py:mod:`~sampler`.
+
+    Returns:
+        A GET request returns the stacks in the collapsed stack format.
+
+    """
+    if not isAdminSession():
+        abort(404)
+
+    stacks = sampler.collapsed(request.args.get('endpoint'))
+
+    if request.args.get('reset'):
+        sampler.reset()
+
+    return Response(stacks, mimetype="text/plain")
+
+
+@app.route('/debug/memory')
+def debugMemory():
+    """JSON endpoint that returns the memory allocated by recent requests
+    to an administrator.
+
+    Note:
+        Requests are only measured while MEMORY_TRACKING is set.  Refer to
+        :py:mod:`~memory` for the values reported.
+
+    Returns:
+        A GET request returns the totals for each route and the recent
+        requests' peak and net allocations and top allocation sites.
+
+    """
+    if not isAdminSession():
+        abort(404)
+
+    return jsonify(Memory=memoryTracker.serialize)
 
 
 # Routes for Authentication with Google
+@app.route('/login/state')
+def loginState():
+    """Provide the state a user signing in with Google sends to gconnect.
+
+    Note:
+        The state is only added to the login session when the user signs in,
+        so pages can be viewed without a session, and shared by caches.
+
+    Returns:
+        JSON containing the login session's state.
+
+    """
+    response = jsonify(state=getLoginSessionState())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @app.route('/gconnect', methods=['POST'])
 def gconnect():
     """Refer to :py:func:`~auth.ConnectGoogle`"""
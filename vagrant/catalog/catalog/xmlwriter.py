@@ -0,0 +1,148 @@
+'''
+This is the xmlwriter module for the Catalog app.
+The module writes the serialized Catalog as an XML document, incrementally,
+so that the document can be streamed as the Catalog is read from the
+database.
+
+The document has the same layout the Catalog's XML endpoint produced with
+dicttoxml: every element carries a type attribute, list entries are
+wrapped in item elements and the child elements of a Category or an Item
+are written in the same order.
+
+Attributes:
+    CATEGORY_KEYS (list):   The order of the child elements of a Category.
+    ITEM_KEYS (list):       The order of the child elements of an Item.
+
+'''
+import zlib
+
+CATEGORY_KEYS = ['creator', 'id', 'name', 'version']
+ITEM_KEYS = [
+    'picture',
+    'description',
+    'creator',
+    'cat_id',
+    'dateCreated',
+    'id',
+    'name',
+    'version'
+]
+
+
+def escapeXML(value):
+    '''Escape the characters in a string that have special meaning in XML.
+
+    Args:
+        value (string): The text to escape.
+
+    Returns:
+        string: The text with &, ", ', < and > replaced by entities.
+    '''
+    return value.replace(
+        '&', '&amp;'
+    ).replace(
+        '"', '&quot;'
+    ).replace(
+        '\'', '&apos;'
+    ).replace(
+        '<', '&lt;'
+    ).replace(
+        '>', '&gt;'
+    )
+
+
+def valueElement(key, value):
+    '''Write a single value as an XML element with its type attribute.
+
+    Args:
+        key (string):   The element name.
+        value (object): A string, an integer or None.
+
+    Returns:
+        unicode: The XML element.
+    '''
+    if value is None:
+        return u'<%s type="null"></%s>' % (key, key)
+
+    if isinstance(value, basestring):
+        return u'<%s type="str">%s</%s>' % (key, escapeXML(value), key)
+
+    return u'<%s type="int">%s</%s>' % (key, value, key)
+
+
+def itemElement(item):
+    '''Write a serialized Item as XML.
+
+    Args:
+        item (dict): An Item serialized by :py:meth:`~models.Item.serialize`
+
+    Returns:
+        unicode: The Item wrapped in an item element of a list.
+    '''
+    values = item['Item']
+
+    return u'<item type="dict"><Item type="dict">%s</Item></item>' % (
+        u''.join(valueElement(key, values[key]) for key in ITEM_KEYS)
+    )
+
+
+def categoryElement(category):
+    '''Write a serialized Category, including its Items, as XML.
+
+    Args:
+        category (dict): A Category serialized by
+            :py:meth:`~models.Category.serialize`
+
+    Returns:
+        unicode: The Category wrapped in an item element of a list.
+    '''
+    values = category['Category']
+
+    return (
+        u'<item type="dict"><Category type="dict"><Items type="list">%s'
+        u'</Items>%s</Category></item>'
+    ) % (
+        u''.join(itemElement(i) for i in values['Items']),
+        u''.join(valueElement(key, values[key]) for key in CATEGORY_KEYS)
+    )
+
+
+def streamCatalogXML(categories):
+    '''Write the Catalog as an XML document, one Category at a time.
+
+    Args:
+        categories (iterable): The serialized Categories to write.
+
+    Returns:
+        A generator of UTF-8 encoded strings that together form the XML
+        document.
+    '''
+    yield '<?xml version="1.0" encoding="UTF-8" ?><root>'
+
+    for category in categories:
+        yield categoryElement(category).encode('utf-8')
+
+    yield '</root>'
+
+
+def gzipStream(chunks, level=6):
+    '''Compress a stream of strings with gzip as they are produced.
+
+    Args:
+        chunks (iterable):  The strings to compress.
+        level (int):        The zlib compression level.
+
+    Returns:
+        A generator of strings that together form a gzip file of the
+        chunks.
+    '''
+    # Adding 16 to the window bits writes a gzip header and trailer.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
@@ -1,5 +1,5 @@
 from catalog.app import app
-from catalog.database import session, init_db
+from catalog.database import session, init_db, migrate_db
 
 
 @app.teardown_appcontext
@@ -9,6 +9,7 @@ def shutdown_session(exception=None):
 
 if __name__ == "__main__":
     init_db()
+    migrate_db()
     app.secret_key = 'super_secret_key'
     app.debug = True
     app.run(host="0.0.0.0", port=5000)